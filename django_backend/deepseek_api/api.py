@@ -1,43 +1,34 @@
-from ninja import NinjaAPI, Router
-# from ninja.security import BaseAuth
+from ninja import NinjaAPI, Router, Query
+from ninja.errors import HttpError
 from django.http import HttpRequest, StreamingHttpResponse
 from typing import Optional
 from . import services
 from django.conf import settings
-from .schemas import LoginIn, LoginOut, ChatIn, ChatOut, HistoryOut, ErrorResponse
-from .models import APIKey
-from .services import get_or_create_session, deepseek_r1_api_call, get_cached_reply, set_cached_reply
-from .conversation_manager import ConversationManager, ConversationType
+from .schemas import LoginIn, LoginOut, SessionIn, ChatIn, ChatOut, HistoryOut, ErrorResponse
+from .services import (
+    get_or_create_session, adeepseek_r1_api_call, aretrieve_logs, adeepseek_r1_api_call_stream,
+    get_cached_reply, set_cached_reply, save_session_in_background,
+)
+from .conversation_manager import get_conversation_manager, ConversationType
+from .intent_classifier import aclassify_user_intent
+from .semantic_cache import SemanticCache
+from model_config import CURRENT_CONFIG
+from http_client import async_client_scope
+from asgiref.sync import sync_to_async
 from datetime import datetime
+import asyncio
 import logging
 import json
 logger = logging.getLogger(__name__)
 
-# 初始化对话管理器
-conversation_manager = ConversationManager(max_context_length=4000, max_turns=10)
+# 语义缓存：按用户输入的向量相似度复用回复
+semantic_cache = SemanticCache(
+    embedding_model=CURRENT_CONFIG['embedding_model'],
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+)
 
 api = NinjaAPI(title="KAI API", version="0.0.1")
 
-# class ApiKeyAuth(AuthBase):
-    # def authenticate(self, request):
-        # auth_header = request.headers.get("Authorization")
-        # if not auth_header:
-            # return None  # 未提供认证信息，返回None表示认证失败
-        
-        # try:
-            # # 解析 Authorization 头（格式：Bearer <api_key>）
-            # scheme, key = auth_header.split()
-            # if scheme.lower() != "bearer":
-                # return None  # 认证方案不是Bearer，失败
-            
-            # # 查询对应的APIKey对象（验证有效性）
-            # api_key = APIKey.objects.get(key=key)
-            # # 返回APIKey对象（而非字符串），后续可通过request.auth访问
-            # return api_key  
-        # except (ValueError, APIKey.DoesNotExist):
-            # # 解析失败或APIKey不存在，返回None表示认证失败
-            # return None
-
 def api_key_auth(request):
     """验证请求头中的API Key"""
     auth_header = request.headers.get("Authorization")
@@ -50,11 +41,16 @@ def api_key_auth(request):
         if scheme.lower() != "bearer":
             return None  # 认证方案错误
 
-        # 验证API Key是否存在
-        api_key = APIKey.objects.get(key=key)
-        return api_key  # 认证成功，返回APIKey对象
-    except (ValueError, APIKey.DoesNotExist):
-        return None  # 解析失败或Key不存在，认证失败
+        # 验证API Key是否存在（优先命中进程内缓存）
+        api_key = services.get_api_key(key)  # 认证成功返回APIKey对象，Key不存在返回None
+    except ValueError:
+        return None  # 解析失败，认证失败
+    
+    # 按 API Key 限流（固定窗口计数，超出 RATE_LIMIT_MAX 次/RATE_LIMIT_INTERVAL 秒时返回 429）
+    if api_key is not None and not services.check_rate_limit(api_key):
+        logger.warning("⛔ [限流] 用户: %s 请求过于频繁", api_key.user)
+        raise HttpError(429, "请求过于频繁，请稍后再试")
+    return api_key
 
 router = Router(auth=api_key_auth)
 
@@ -77,42 +73,45 @@ def login(request, data: LoginIn):
     return {"api_key": key, "expiry": settings.TOKEN_EXPIRY_SECONDS}
 
 @router.post("/chat", response={200: ChatOut, 401: ErrorResponse})
-def chat(request, data: ChatIn):
-    print("=" * 80)
-    print("🚀 [数据流追踪] 开始处理 Chat 请求")
-    print("=" * 80)
-    
+@async_client_scope()  # 请求结束时关闭本事件循环的 AsyncClient
+async def chat(request, data: ChatIn):
     # 1. 认证验证（确保用户已登录）
     if not request.auth:
-        print("❌ [认证失败] 未提供有效的API Key")
+        logger.info("❌ [认证失败] 未提供有效的API Key")
         return 401, {"error": "请先登录获取API Key"}
     
-    print(f"✅ [认证成功] 用户: {request.auth.user}, API Key: {request.auth.key[:8]}...")
-    
-    # 2. 解析参数（确保 session_id 有效）
-    session_id = data.session_id.strip() or "default_session"
-    user_input = data.user_input.strip()
+    # 2. 解析参数（session_id / user_input 已在 ChatIn 中完成去空白和校验）
+    session_id = data.session_id
+    user_input = data.user_input
     query_type = data.query_type or "analysis"  # 获取查询类型，默认为 analysis
     
-    print(f"📝 [请求参数] session_id: '{session_id}', query_type: '{query_type}'")
-    print(f"📝 [用户输入] {user_input}")
+    logger.info("🚀 [Chat请求] 用户: %s, session_id: '%s', query_type: '%s'", request.auth.user, session_id, query_type)
+    logger.debug("📝 [用户输入] %s", user_input)
     
-    if not user_input:
-        print("❌ [参数错误] 用户输入为空")
-        return 400, {"error": "请输入消息内容"}
+    conversation_manager = get_conversation_manager()
     
     # 3. 获取会话（加载旧会话或创建新会话）
     user = request.auth  # 从认证获取当前用户（APIKey对象）
-    print(f"\n🔍 [会话查询] 正在获取会话 session_id='{session_id}', user='{user.user}'")
-    session = get_or_create_session(session_id, user)
+    log_results = None
+    
+    # 先查精确缓存（缓存后端可能是 Redis，放到线程中读取）：命中时回复已确定，
+    # 跳过意图分类和日志检索，会话仍需加载以写入本轮历史
+    cached_reply = await sync_to_async(get_cached_reply)(user_input, session_id, user)
+    fast_path = query_type == "general_chat" or bool(cached_reply)
     
-    print(f"📊 [会话状态] 会话ID: {session.session_id}")
-    print(f"📊 [会话用户] {session.user.user}")
-    print(f"📊 [历史长度] {len(session.context)} 字符")
-    if session.context:
-        print(f"📊 [历史内容预览] {session.context[:200]}{'...' if len(session.context) > 200 else ''}")
+    if fast_path:
+        session = await sync_to_async(get_or_create_session)(session_id, user)
+        intent_result = None
     else:
-        print("📊 [历史内容] 空（新会话）")
+        # 会话查询（数据库）、意图分类（Ollama/DeepSeek）与日志检索互不依赖，并发执行
+        # analysis 模式一定会走 RAG，因此提前检索；其他模式用 sleep(0) 占位返回 None
+        session, intent_result, log_results = await asyncio.gather(
+            sync_to_async(get_or_create_session)(session_id, user),
+            aclassify_user_intent(user_input),
+            aretrieve_logs(user_input) if query_type == "analysis" else asyncio.sleep(0),
+        )
+    
+    logger.debug("📊 [会话状态] 会话ID: %s, 历史长度: %d 字符", session.session_id, len(session.context))
     
     # 4. 初始化变量（确保在所有路径下都有定义）
     historical_turns = []
@@ -122,29 +121,20 @@ def chat(request, data: ChatIn):
     rag_decision = {}
     use_rag = False
     
-    # 快速路径：日常聊天模式优化
-    if query_type == "general_chat":
-        # 日常聊天模式：快速路径，跳过意图分类和复杂上下文处理
-        print(f"\n💬 [日常聊天快速路径] 跳过意图分类，直接处理")
+    # 快速路径：日常聊天模式或精确缓存命中
+    if fast_path:
+        # 快速路径：跳过意图分类和复杂上下文处理（缓存命中时分类结果只会写入元数据）
         use_rag = False
         
-        # 简化上下文处理：只保留最近几轮对话
-        historical_turns = conversation_manager.parse_conversation_history(session.context)
-        # 只保留最近3轮，避免上下文过长
-        recent_turns = historical_turns[-3:] if len(historical_turns) > 3 else historical_turns
-        compressed_turns = recent_turns
-        
-        # 构建简单的对话上下文
-        if compressed_turns:
-            context_parts = []
-            for turn in compressed_turns:
-                context_parts.append(f"用户：{turn.user_input}")
-                context_parts.append(f"回复：{turn.assistant_reply}")
-            context_parts.append(f"用户：{user_input}")
-            context_parts.append("回复：")
-            llm_context = "\n".join(context_parts)
+        historical_turns = await sync_to_async(
+            conversation_manager.load_history, thread_sensitive=False
+        )(session.turns, session.context)
+        if query_type == "general_chat":
+            # 简化上下文处理：只保留最近3轮，避免上下文过长
+            recent_turns = historical_turns[-3:] if len(historical_turns) > 3 else historical_turns
+            compressed_turns = recent_turns
         else:
-            llm_context = f"用户：{user_input}\n回复："
+            compressed_turns = conversation_manager.compress_context(historical_turns)
         
         # 简化分类信息（用于日志）
         conversation_type = ConversationType.GENERAL_QA
@@ -161,96 +151,73 @@ def chat(request, data: ChatIn):
             'intent_type': 'general_qa',
             'conversation_type': 'general_qa',
             'use_rag': False,
-            'decision_reason': '前端选择日常聊天模式，快速路径处理'
+            'decision_reason': ('前端选择日常聊天模式，快速路径处理' if query_type == "general_chat"
+                                else '精确缓存命中，跳过意图分类和RAG检索')
         }
         
-        print(f"💬 [快速路径] 使用简化上下文，跳过意图分类")
+        logger.debug("💬 [快速路径] 跳过意图分类，保留 %d 轮对话", len(compressed_turns))
     else:
         # 日志分析模式：完整处理流程
-        print(f"\n🧠 [智能对话管理] 开始分析对话类型和上下文...")
-        
         # 解析历史对话
-        historical_turns = conversation_manager.parse_conversation_history(session.context)
-        print(f"🧠 [历史解析] 解析出 {len(historical_turns)} 轮历史对话")
+        historical_turns = await sync_to_async(
+            conversation_manager.load_history, thread_sensitive=False
+        )(session.turns, session.context)
         
         # 使用轻量级模型分类当前对话类型
-        conversation_type, classification_details = conversation_manager.classify_conversation_type(user_input, len(historical_turns) > 0)
-        print(f"🧠 [智能分类] 对话类型: {conversation_type.value}")
-        print(f"🧠 [分类详情] 意图: {classification_details['intent_type']}, 置信度: {classification_details['confidence']:.3f}")
-        print(f"🧠 [模型信息] 使用模型: {classification_details['model_used']}, 耗时: {classification_details['processing_time']:.3f}秒")
+        conversation_type, classification_details = conversation_manager.classify_conversation_type(
+            user_input, len(historical_turns) > 0, intent_result
+        )
+        logger.info(
+            "🧠 [智能分类] 对话类型: %s, 意图: %s, 置信度: %.3f, 模型: %s, 耗时: %.3f秒",
+            conversation_type.value, classification_details['intent_type'], classification_details['confidence'],
+            classification_details['model_used'], classification_details['processing_time']
+        )
         
         # 压缩历史上下文
         compressed_turns = conversation_manager.compress_context(historical_turns)
-        print(f"🧠 [上下文压缩] 压缩后保留 {len(compressed_turns)} 轮对话")
+        logger.debug("🧠 [上下文压缩] 历史 %d 轮，压缩后保留 %d 轮", len(historical_turns), len(compressed_turns))
         
         # 使用意图分类结果判断是否需要RAG检索
-        use_rag, rag_decision = conversation_manager.should_use_rag(conversation_type, user_input, classification_details)
+        use_rag, rag_decision = conversation_manager.should_use_rag(
+            conversation_type, user_input, classification_details, intent_result
+        )
         
         # 日志分析模式，强制使用RAG
         if query_type == "analysis":
             use_rag = True
             rag_decision['decision_reason'] = "前端选择日志分析模式，使用RAG检索"
-            print(f"🔍 [日志分析] 前端选择日志分析模式，使用RAG检索")
-        
-        print(f"🧠 [智能RAG决策] 使用RAG: {use_rag}")
-        print(f"🧠 [决策原因] {rag_decision['decision_reason']}")
-        print(f"🧠 [决策详情] 意图置信度: {rag_decision['intent_confidence']:.3f}, 意图类型: {rag_decision['intent_type']}")
         
-        # 构建LLM上下文
-        llm_context = conversation_manager.build_context_for_llm(compressed_turns, user_input, conversation_type)
+        logger.info("🧠 [智能RAG决策] 使用RAG: %s, 原因: %s", use_rag, rag_decision['decision_reason'])
     
-    if query_type == "general_chat":
-        print(f"\n💬 [快速路径上下文]")
-        print(f"   保留轮次: {len(compressed_turns)}")
-        print(f"   上下文长度: {len(llm_context)} 字符")
-    else:
-        print(f"\n🔧 [上下文构建]")
-        print(f"   原始历史长度: {len(session.context)} 字符")
-        print(f"   压缩后长度: {len(llm_context)} 字符")
-        print(f"   对话类型: {conversation_type.value}")
-        print(f"   使用RAG: {use_rag}")
-        print(f"🔧 [LLM上下文] ↓↓↓")
-        print("-" * 60)
-        print(llm_context)
-        print("-" * 60)
+    # LLM 上下文目前只用于调试输出，可能有数 KB，仅在 DEBUG 级别时才构建
+    if logger.isEnabledFor(logging.DEBUG):
+        llm_context = conversation_manager.build_context_for_llm(compressed_turns, user_input, conversation_type)
+        logger.debug("🔧 [LLM上下文] 长度: %d 字符\n%s", len(llm_context), llm_context)
     
-    # 根据对话类型选择不同的处理逻辑
-    logger.info(f"传递给大模型的prompt：\n{llm_context}")  # 调试日志
-    logger.info(f"查询类型：{query_type}")  # 记录查询类型
+    # 5. 调用大模型（根据 query_type 选择策略；精确缓存已在请求开始时查询）
+    # 精确缓存未命中时查语义缓存（RAG 回复依赖检索结果，不走语义缓存以免返回过期答案）
+    query_embedding = None
+    if not cached_reply and not use_rag:
+        query_embedding = await semantic_cache.aembed(user_input)
+        if query_embedding is not None:
+            cached_reply = semantic_cache.lookup(query_embedding, session_id, user.user)
     
-    # 5. 调用大模型（根据 query_type 选择策略）
-    print(f"\n🔍 [缓存检查] 检查是否有缓存回复...")
-    cached_reply = get_cached_reply(user_input, session_id, user)
     if cached_reply:
         reply = cached_reply
-        print(f"✅ [缓存命中] 使用缓存回复，长度: {len(reply)} 字符")
-        print(f"💾 [缓存回复] {reply[:100]}{'...' if len(reply) > 100 else ''}")
+        logger.info("✅ [缓存命中] 使用缓存回复，长度: %d 字符", len(reply))
     else:
-        print(f"❌ [缓存未命中] 调用大模型API...")
-        
-        if query_type == "analysis":
-            # 日志分析模式：使用 RAG
-            print(f"🔍 [RAG模式] 日志分析，使用 RAG 检索")
-            print(f"🔍 [RAG查询] 原始查询: '{user_input}'")
-            reply = deepseek_r1_api_call(user_input, query_type)
-        else:
-            # 日常聊天模式：直接调用 LLM，不使用 RAG
-            print(f"💬 [对话模式] 日常聊天，不使用 RAG 检索")
-            print(f"💬 [对话查询] 查询: '{user_input}'")
-            reply = deepseek_r1_api_call(user_input, query_type)
-        
-        print(f"🤖 [大模型回复] 长度: {len(reply)} 字符")
-        print(f"🤖 [回复内容] {reply[:100]}{'...' if len(reply) > 100 else ''}")
+        # analysis: 日志分析模式，使用 RAG；general_chat: 日常聊天，直接调用 LLM
+        reply = await adeepseek_r1_api_call(user_input, query_type, intent_result, log_results)
+        logger.info("🤖 [大模型回复] 长度: %d 字符", len(reply))
         
         # 设置缓存时传入session_id和user
         set_cached_reply(user_input, reply, session_id, user)
-        print(f"💾 [缓存保存] 回复已缓存")
+        if query_embedding is not None:
+            semantic_cache.store(query_embedding, reply, session_id, user.user)
     
-    # 6. 智能上下文保存 → 改进！
-    print(f"\n💾 [智能上下文保存] 使用对话管理器更新历史...")
-    
-    # 添加新的对话轮次
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # 6. 智能上下文保存
+    # 添加新的对话轮次（只取一次当前时间，isoformat 输出 "YYYY-MM-DD HH:MM:SS"）
+    timestamp = datetime.now().isoformat(" ", "seconds")
     metadata = {
         "query_type": query_type,
         "conversation_type": conversation_type.value,
@@ -266,42 +233,24 @@ def chat(request, data: ChatIn):
         compressed_turns, user_input, reply, conversation_type, timestamp, metadata
     )
     
-    print(f"💾 [对话轮次] 添加新轮次，当前总轮次: {len(updated_turns)}")
-    print(f"💾 [元数据] {metadata}")
-    
     # 格式化为存储字符串
     new_context = conversation_manager.format_context_for_storage(updated_turns)
-    old_context_length = len(session.context)
-    new_context_length = len(new_context)
-    
-    print(f"💾 [上下文更新] 长度变化: {old_context_length} → {new_context_length} 字符")
-    print(f"💾 [压缩效果] 压缩比: {new_context_length/max(old_context_length, 1):.2f}")
+    logger.debug("💾 [上下文更新] 轮次: %d, 长度变化: %d → %d 字符", len(updated_turns), len(session.context), len(new_context))
     
     # 更新会话
     session.context = new_context
-    session.save()
-    
-    print(f"💾 [保存完成] 智能上下文已保存到数据库")
-    print(f"💾 [最终状态] 会话ID: {session.session_id}, 轮次: {len(updated_turns)}, 长度: {len(session.context)} 字符")
-    
-    # session.update_context(user_input, reply)
-    
-    print(f"\n✅ [请求完成] 返回回复给前端")
-    print("=" * 80)
+    session.turns = conversation_manager.serialize_turns(updated_turns)
+    save_session_in_background(session)  # 写库不阻塞响应
 
     return {
         "reply": reply,
         # 前端需要的时间戳由前端生成，后端可返回当前时间供参考
-        "timestamp": datetime.now().strftime("%H:%M:%S")
+        "timestamp": timestamp[11:]  # HH:MM:SS
     }
 
 @router.post("/chat/stream")
-def chat_stream(request, data: ChatIn):
-    """流式聊天接口"""
-    print("=" * 80)
-    print("🚀 [流式对话] 开始处理 Stream Chat 请求")
-    print("=" * 80)
-    
+async def chat_stream(request, data: ChatIn):
+    """流式聊天接口（异步：等待模型输出时不占用工作线程）"""
     # 认证验证
     if not request.auth:
         return StreamingHttpResponse(
@@ -309,85 +258,88 @@ def chat_stream(request, data: ChatIn):
             content_type='text/event-stream'
         )
     
-    session_id = data.session_id.strip() or "default_session"
-    user_input = data.user_input.strip()
+    session_id = data.session_id
+    user_input = data.user_input
     query_type = data.query_type or "general_chat"
     
-    print(f"📝 [流式请求] session_id: '{session_id}', query_type: '{query_type}'")
-    print(f"📝 [用户输入] {user_input}")
-    
-    if not user_input:
-        return StreamingHttpResponse(
-            iter([f"data: {json.dumps({'error': '请输入消息内容'})}\n\n"]),
-            content_type='text/event-stream'
-        )
+    logger.info("🚀 [流式请求] 用户: %s, session_id: '%s', query_type: '%s'", request.auth.user, session_id, query_type)
+    logger.debug("📝 [用户输入] %s", user_input)
     
     # 获取会话
     user = request.auth
-    session = get_or_create_session(session_id, user)
-    
-    def stream_generator():
-        """生成器函数：流式返回"""
-        try:
-            from model_config import CURRENT_CONFIG
-            use_api = CURRENT_CONFIG.get('use_api', False)
-            
-            if not use_api:
-                # 非 API 模式，返回错误
-                yield f"data: {json.dumps({'error': '流式输出仅支持 API 模式'})}\n\n"
-                return
-            
-            # 使用新的流式调用函数（支持 RAG 和历史上下文）
-            from .services import deepseek_r1_api_call_stream
-            
-            print(f"🤖 [流式调用] 开始流式生成，query_type: {query_type}")
-            print(f"🤖 [会话历史] 历史长度: {len(session.context)} 字符")
-            
-            # 调用流式函数，传递历史上下文
-            stream_response = deepseek_r1_api_call_stream(
-                user_input, 
-                query_type, 
-                history_context=session.context  # 传递历史上下文
-            )
-            
-            full_reply = ""
-            for response in stream_response:
-                delta = response.delta if hasattr(response, 'delta') else ""
-                if delta:
-                    full_reply += delta
-                    # 发送增量内容
-                    yield f"data: {json.dumps({'delta': delta, 'content': full_reply})}\n\n"
-            
-            # 保存到会话历史
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            metadata = {
-                "query_type": query_type,
-                "stream": True,
-            }
-            
-            from .conversation_manager import ConversationType
-            
-            # 解析现有历史
-            historical_turns = conversation_manager.parse_conversation_history(session.context)
-            
-            # 添加新的对话轮次
-            updated_turns = conversation_manager.add_new_turn(
-                historical_turns, user_input, full_reply, ConversationType.GENERAL_QA, timestamp, metadata
-            )
-            
-            new_context = conversation_manager.format_context_for_storage(updated_turns)
-            session.context = new_context
-            session.save()
-            
-            # 发送完成信号
-            yield f"data: {json.dumps({'done': True, 'content': full_reply})}\n\n"
-            print(f"✅ [流式完成] 总长度: {len(full_reply)} 字符")
-            
-        except Exception as e:
-            error_msg = str(e)
-            print(f"❌ [流式错误] {error_msg}")
-            yield f"data: {json.dumps({'error': error_msg})}\n\n"
-    
+    session = await sync_to_async(get_or_create_session)(session_id, user)
+    
+    async def stream_generator():
+        """异步生成器：流式返回"""
+        # 流式内容在独立的事件循环中消费，生成结束时关闭该事件循环的 AsyncClient
+        async with async_client_scope():
+            try:
+                use_api = CURRENT_CONFIG.get('use_api', False)
+                
+                if not use_api:
+                    # 非 API 模式，返回错误
+                    yield f"data: {json.dumps({'error': '流式输出仅支持 API 模式'})}\n\n"
+                    return
+                
+                cached_reply = await sync_to_async(get_cached_reply)(user_input, session_id, user)
+                if cached_reply:
+                    # 缓存命中：一次性推送完整回复，无需调用大模型
+                    full_reply = cached_reply
+                    logger.info("✅ [缓存命中] 使用缓存回复，长度: %d 字符", len(full_reply))
+                    yield f"data: {json.dumps({'delta': full_reply, 'content': full_reply})}\n\n"
+                else:
+                    # 调用流式函数（支持 RAG 和历史上下文），优先传递已压缩的结构化轮次
+                    stream_response = await adeepseek_r1_api_call_stream(
+                        user_input, 
+                        query_type, 
+                        history_context=session.context,  # 旧会话没有结构化轮次时回退解析
+                        history_turns=session.turns,  # 已压缩的结构化轮次
+                    )
+                    
+                    full_reply = ""
+                    async for response in stream_response:
+                        delta = response.delta if hasattr(response, 'delta') else ""
+                        if delta:
+                            # LLM 已在 message.content 中累积完整文本，直接复用，不再重复拼接
+                            full_reply = response.message.content
+                            # 发送增量内容
+                            yield f"data: {json.dumps({'delta': delta, 'content': full_reply})}\n\n"
+                    
+                    # 流结束后写入回复缓存，与非流式接口共享
+                    if full_reply:
+                        set_cached_reply(user_input, full_reply, session_id, user)
+                
+                # 保存到会话历史
+                timestamp = datetime.now().isoformat(" ", "seconds")
+                metadata = {
+                    "query_type": query_type,
+                    "stream": True,
+                }
+                
+                conversation_manager = get_conversation_manager()
+                
+                # 解析现有历史
+                historical_turns = conversation_manager.load_history(session.turns, session.context)
+                
+                # 添加新的对话轮次
+                updated_turns = conversation_manager.add_new_turn(
+                    historical_turns, user_input, full_reply, ConversationType.GENERAL_QA, timestamp, metadata
+                )
+                
+                new_context = conversation_manager.format_context_for_storage(updated_turns)
+                session.context = new_context
+                session.turns = conversation_manager.serialize_turns(updated_turns)
+                save_session_in_background(session)
+                
+                # 发送完成信号
+                yield f"data: {json.dumps({'done': True, 'content': full_reply})}\n\n"
+                logger.info("✅ [流式完成] 总长度: %d 字符", len(full_reply))
+                
+            except Exception as e:
+                error_msg = str(e)
+                logger.error("❌ [流式错误] %s", error_msg)
+                yield f"data: {json.dumps({'error': error_msg})}\n\n"
+        
     response = StreamingHttpResponse(
         stream_generator(),
         content_type='text/event-stream'
@@ -398,59 +350,28 @@ def chat_stream(request, data: ChatIn):
 
 # 1. 修复 history 接口
 @router.get("/history", response={200: HistoryOut})
-def history(request, session_id: str = "default_session"):
+def history(request, params: Query[SessionIn]):
     """查看对话历史接口：根据session_id返回对话历史"""
-    print("=" * 80)
-    print("📚 [历史查询] 开始处理 History 请求")
-    print("=" * 80)
-    
-    # 直接使用 session_id 参数，无需通过 data
-    processed_session_id = session_id.strip() or "default_session"
-    user_api_key = request.auth.key
-    
-    print(f"📚 [查询参数] session_id: '{processed_session_id}'")
-    print(f"📚 [用户信息] user: '{request.auth.user}', API Key: {user_api_key[:8]}...")
+    processed_session_id = params.session_id
     
     session = services.get_or_create_session(processed_session_id, request.auth)
     
-    print(f"📚 [历史内容] 长度: {len(session.context)} 字符")
-    if session.context:
-        print(f"📚 [内容预览] {session.context[:200]}{'...' if len(session.context) > 200 else ''}")
-    else:
-        print("📚 [内容预览] 空（无历史记录）")
-    
-    print(f"📚 [返回结果] 历史记录已准备完毕")
-    print("=" * 80)
+    logger.debug("📚 [历史查询] 用户: %s, session_id: '%s', 历史长度: %d 字符",
+                 request.auth.user, processed_session_id, len(session.context))
     
     return {"history": session.context}
 
 
 # 2. 修复 clear_history 接口
 @router.delete("/history", response={200: dict})
-def clear_history(request, session_id: str = "default_session"):
+def clear_history(request, params: Query[SessionIn]):
     """清空对话历史接口"""
-    print("=" * 80)
-    print("🗑️ [历史清空] 开始处理 Clear History 请求")
-    print("=" * 80)
-    
-    # 直接使用 session_id 参数，无需通过 data
-    processed_session_id = session_id.strip() or "default_session"
-    user_api_key = request.auth.key
-    
-    print(f"🗑️ [清空参数] session_id: '{processed_session_id}'")
-    print(f"🗑️ [用户信息] user: '{request.auth.user}', API Key: {user_api_key[:8]}...")
-    
-    session = services.get_or_create_session(processed_session_id, request.auth)
-    
-    print(f"🗑️ [清空前状态] 历史长度: {len(session.context)} 字符")
-    if session.context:
-        print(f"🗑️ [清空前内容] {session.context[:100]}{'...' if len(session.context) > 100 else ''}")
+    processed_session_id = params.session_id
     
-    session.clear_context()
+    services.clear_session(processed_session_id, request.auth)
+    semantic_cache.clear(processed_session_id, request.auth.user)
     
-    print(f"🗑️ [清空完成] 历史记录已清空")
-    print(f"🗑️ [清空后状态] 历史长度: {len(session.context)} 字符")
-    print("=" * 80)
+    logger.info("🗑️ [历史清空] 用户: %s, session_id: '%s'", request.auth.user, processed_session_id)
     
     return {"message": "历史记录已清空"}
 
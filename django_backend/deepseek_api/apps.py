@@ -1,5 +1,52 @@
+import logging
+import os
+import sys
+import threading
+
 from django.apps import AppConfig
 
+logger = logging.getLogger(__name__)
+
+
+def _should_warmup() -> bool:
+    """只在真正提供服务的进程中预热模型（跳过 migrate/check 等管理命令和 runserver 的监控进程）"""
+    if os.getenv("OLLAMA_WARMUP", "1") == "0":
+        return False
+    if os.path.basename(sys.argv[0]) == "manage.py":
+        if len(sys.argv) < 2 or sys.argv[1] != "runserver":
+            return False
+        # 自动重载模式下，只有 RUN_MAIN=true 的子进程处理请求
+        if "--noreload" not in sys.argv and os.environ.get("RUN_MAIN") != "true":
+            return False
+    return True
+
+
+def _warmup_models():
+    """预加载意图分类模型以及本地 RAG 所需的 LLM / Embedding 模型"""
+    from http_client import warmup_ollama_model
+    from model_config import CURRENT_CONFIG
+    from .intent_classifier import get_intent_classifier
+
+    classifier = get_intent_classifier()
+    targets = []
+    if not classifier.use_api:
+        targets.append((classifier.model_name, False))
+    if not CURRENT_CONFIG.get('use_api', False):
+        targets.append((CURRENT_CONFIG['llm'], False))
+    targets.append((CURRENT_CONFIG['embedding_model'], True))
+
+    for model, embedding in targets:
+        if warmup_ollama_model(model, classifier.ollama_url, embedding=embedding):
+            logger.info(f"🔥 模型预热完成: {model}")
+        else:
+            logger.warning(f"⚠️  模型预热失败（Ollama 未启动或模型未安装）: {model}")
+
+
 class DeepseekApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'deepseek_api'
+
+    def ready(self):
+        if _should_warmup():
+            # 后台线程执行，避免阻塞启动
+            threading.Thread(target=_warmup_models, name="ollama-warmup", daemon=True).start()
@@ -5,13 +5,35 @@
 
 import json
 import logging
-from typing import List, Dict, Optional, Tuple
-from dataclasses import dataclass
+import re
+import threading
+from collections import deque
+from typing import Iterator, List, Dict, Optional, Tuple
+from dataclasses import dataclass, field
 from enum import Enum
-from .intent_classifier import get_intent_classifier, IntentType, classify_user_intent, is_rag_required
+from .intent_classifier import IntentType, IntentResult, classify_user_intent, is_rag_required
 
 logger = logging.getLogger(__name__)
 
+# 追问特征词（预编译为一个正则，一次扫描完成匹配）
+FOLLOW_UP_INDICATORS = ('继续', '详细', '更多', '具体', '再', '进一步')
+_FOLLOW_UP_PATTERN = re.compile("|".join(map(re.escape, FOLLOW_UP_INDICATORS)))
+
+# 摘要中提取主题用的技术术语
+TECHNICAL_TERMS = ('数据库', '索引', '连接', '性能', '错误', '日志', '服务', '系统')
+_TECHNICAL_TERM_PATTERN = re.compile("|".join(map(re.escape, TECHNICAL_TERMS)))
+
+# 存储/上下文格式中的固定标记（各处共用同一组字符串对象）
+_USER_MARKER = "用户："
+_REPLY_MARKER = "\n回复："
+_TURN_END = "\n"
+
+# 存储格式中的一轮对话：回复一直延续到下一行的 "用户：" 或字符串结尾
+_TURN_PATTERN = re.compile(r'用户：(.*?)\n回复：(.*?)(?=\n用户：|\Z)', re.S)
+
+# 追问时仍需要 RAG 检索的技术类意图
+_TECHNICAL_FOLLOW_UP_INTENTS = frozenset({IntentType.LOG_ANALYSIS, IntentType.TECHNICAL_HELP})
+
 class ConversationType(Enum):
     """对话类型枚举（保持向后兼容）"""
     GENERAL_QA = "general_qa"           # 通用问答
@@ -22,14 +44,37 @@ class ConversationType(Enum):
     GREETING = "greeting"               # 问候
     UNKNOWN = "unknown"                 # 未知意图
 
-@dataclass
+# 映射IntentType到ConversationType（未列出的意图按通用问答处理）
+_INTENT_TO_CONVERSATION_TYPE: Dict[IntentType, ConversationType] = {
+    IntentType.GENERAL_QA: ConversationType.GENERAL_QA,
+    IntentType.LOG_ANALYSIS: ConversationType.LOG_ANALYSIS,
+    IntentType.FOLLOW_UP: ConversationType.FOLLOW_UP,
+    IntentType.SUMMARY_REQUEST: ConversationType.SUMMARY_REQUEST,
+    IntentType.TECHNICAL_HELP: ConversationType.TECHNICAL_HELP,
+    IntentType.GREETING: ConversationType.GENERAL_QA,  # 问候归类为通用问答
+    IntentType.UNKNOWN: ConversationType.GENERAL_QA
+}
+
+@dataclass(slots=True)
 class ConversationTurn:
-    """单轮对话数据结构"""
+    """单轮对话数据结构（slots：不为每个实例创建 __dict__）"""
     user_input: str
     assistant_reply: str
     conversation_type: ConversationType
     timestamp: str
     metadata: Dict = None  # 存储额外信息，如检索到的日志数量等
+    char_len: int = field(init=False, repr=False, compare=False)  # 用户输入 + 回复的字符数，创建时计算一次
+    _segment: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        self.char_len = len(self.user_input) + len(self.assistant_reply)
+    
+    @property
+    def segment(self) -> str:
+        """本轮的文本片段 "用户：...\n回复：...\n"，首次访问时生成并缓存，之后各次拼接复用同一字符串"""
+        if self._segment is None:
+            self._segment = "".join((_USER_MARKER, self.user_input, _REPLY_MARKER, self.assistant_reply, _TURN_END))
+        return self._segment
 
 class ConversationManager:
     """多轮对话管理器"""
@@ -45,40 +90,32 @@ class ConversationManager:
         self.max_context_length = max_context_length
         self.max_turns = max_turns
     
-    def classify_conversation_type(self, user_input: str, has_history: bool) -> Tuple[ConversationType, Dict]:
+    def classify_conversation_type(self, user_input: str, has_history: bool,
+                                   intent_result: Optional[IntentResult] = None) -> Tuple[ConversationType, Dict]:
         """
         使用轻量级模型分类对话类型
         
         Args:
             user_input: 用户输入
             has_history: 是否有历史对话
+            intent_result: 已有的意图分类结果（如异步视图中预先分类），为空时现场分类
             
         Returns:
             对话类型和分类详情
         """
         # 使用轻量级意图分类器
-        intent_result = classify_user_intent(user_input)
+        if intent_result is None:
+            intent_result = classify_user_intent(user_input)
         
         # 映射IntentType到ConversationType
-        intent_mapping = {
-            IntentType.GENERAL_QA: ConversationType.GENERAL_QA,
-            IntentType.LOG_ANALYSIS: ConversationType.LOG_ANALYSIS,
-            IntentType.FOLLOW_UP: ConversationType.FOLLOW_UP,
-            IntentType.SUMMARY_REQUEST: ConversationType.SUMMARY_REQUEST,
-            IntentType.TECHNICAL_HELP: ConversationType.TECHNICAL_HELP,
-            IntentType.GREETING: ConversationType.GENERAL_QA,  # 问候归类为通用问答
-            IntentType.UNKNOWN: ConversationType.GENERAL_QA
-        }
-        
-        conversation_type = intent_mapping.get(intent_result.intent, ConversationType.GENERAL_QA)
+        conversation_type = _INTENT_TO_CONVERSATION_TYPE.get(intent_result.intent, ConversationType.GENERAL_QA)
         
         # 如果有历史对话，进一步判断是否是追问
         if has_history and intent_result.intent == IntentType.FOLLOW_UP:
             conversation_type = ConversationType.FOLLOW_UP
         elif has_history and intent_result.confidence < 0.5:
             # 低置信度时，检查是否包含追问特征
-            follow_up_indicators = ['继续', '详细', '更多', '具体', '再', '进一步']
-            if any(indicator in user_input for indicator in follow_up_indicators):
+            if _FOLLOW_UP_PATTERN.search(user_input):
                 conversation_type = ConversationType.FOLLOW_UP
         
         # 返回分类结果和详细信息
@@ -93,6 +130,32 @@ class ConversationManager:
         
         return conversation_type, classification_details
     
+    def iter_turns(self, context_string: str) -> Iterator[ConversationTurn]:
+        """
+        逐轮解析对话历史字符串（生成器，调用方只需要末尾几轮时可配合 deque(maxlen=N) 使用）
+        
+        Args:
+            context_string: 原始上下文字符串
+            
+        Yields:
+            对话轮次
+        """
+        # 按照 "用户：...\n回复：...\n" 的格式解析，一次正则扫描完成
+        for match in _TURN_PATTERN.finditer(context_string):
+            user_input = match.group(1).strip()
+            assistant_reply_text = match.group(2).strip()
+            if not assistant_reply_text:
+                continue
+            
+            # 历史轮次的类型不参与后续决策，不再逐轮调用意图分类器
+            yield ConversationTurn(
+                user_input=user_input,
+                assistant_reply=assistant_reply_text,
+                conversation_type=ConversationType.GENERAL_QA,
+                timestamp="",  # 历史数据没有时间戳
+                metadata={}
+            )
+    
     def parse_conversation_history(self, context_string: str) -> List[ConversationTurn]:
         """
         解析对话历史字符串为结构化数据
@@ -103,43 +166,66 @@ class ConversationManager:
         Returns:
             对话轮次列表
         """
-        turns = []
-        if not context_string.strip():
-            return turns
+        return list(self.iter_turns(context_string))
+    
+    def serialize_turns(self, turns: List[ConversationTurn]) -> List[Dict]:
+        """
+        将对话轮次转换为可存入 JSONField 的字典列表
         
-        # 按照 "用户：...\\n回复：...\\n" 的格式解析
-        parts = context_string.split('用户：')[1:]  # 跳过第一个空元素
+        Args:
+            turns: 对话轮次列表
+            
+        Returns:
+            字典列表（u: 用户输入, r: 回复, type: 对话类型, ts: 时间戳, meta: 元数据）
+            取默认值的 type/ts/meta 不写入，由 deserialize_turns 补全，减小每轮的存储体积
+        """
+        records = []
+        for turn in turns:
+            record = {"u": turn.user_input, "r": turn.assistant_reply}
+            if turn.conversation_type is not ConversationType.GENERAL_QA:
+                record["type"] = turn.conversation_type.value
+            if turn.timestamp:
+                record["ts"] = turn.timestamp
+            if turn.metadata:
+                record["meta"] = turn.metadata
+            records.append(record)
+        return records
+    
+    def deserialize_turns(self, records: List[Dict]) -> List[ConversationTurn]:
+        """
+        将 JSONField 中的字典列表还原为对话轮次
         
-        for part in parts:
-            if '回复：' in part:
-                user_part, reply_part = part.split('回复：', 1)
-                user_input = user_part.strip()
-                
-                # 找到回复的结束位置（下一个"用户："或字符串结尾）
-                reply_lines = reply_part.split('\n')
-                assistant_reply = []
-                
-                for line in reply_lines:
-                    if line.strip() == '':
-                        continue
-                    assistant_reply.append(line)
-                
-                if assistant_reply:
-                    assistant_reply_text = '\n'.join(assistant_reply)
-                    
-                    # 推断对话类型（简化版）
-                    conv_type = self.classify_conversation_type(user_input, len(turns) > 0)
-                    
-                    turn = ConversationTurn(
-                        user_input=user_input,
-                        assistant_reply=assistant_reply_text,
-                        conversation_type=conv_type,
-                        timestamp="",  # 历史数据没有时间戳
-                        metadata={}
-                    )
-                    turns.append(turn)
-        
-        return turns
+        Args:
+            records: serialize_turns 生成的字典列表
+            
+        Returns:
+            对话轮次列表
+        """
+        return [
+            ConversationTurn(
+                user_input=record["u"],
+                assistant_reply=record["r"],
+                conversation_type=ConversationType(record.get("type", ConversationType.GENERAL_QA.value)),
+                timestamp=record.get("ts", ""),
+                metadata=record.get("meta") or {}
+            )
+            for record in records
+        ]
+    
+    def load_history(self, turn_records: List[Dict], context_string: str) -> List[ConversationTurn]:
+        """
+        加载会话历史：优先使用结构化轮次，旧会话只有上下文字符串时回退到解析
+        
+        Args:
+            turn_records: 会话的结构化轮次（ConversationSession.turns）
+            context_string: 会话的上下文字符串（ConversationSession.context）
+            
+        Returns:
+            对话轮次列表
+        """
+        if turn_records:
+            return self.deserialize_turns(turn_records)
+        return self.parse_conversation_history(context_string)
     
     def compress_context(self, turns: List[ConversationTurn]) -> List[ConversationTurn]:
         """
@@ -155,12 +241,19 @@ class ConversationManager:
             return turns
         
         # 策略1：保留最近的对话
-        recent_turns = turns[-self.max_turns:]
-        
-        # 策略2：如果还是太长，进行摘要压缩
-        total_length = sum(len(turn.user_input) + len(turn.assistant_reply) for turn in recent_turns)
+        return self._summarize_if_too_long(turns[-self.max_turns:])
+    
+    def _summarize_if_too_long(self, recent_turns: List[ConversationTurn]) -> List[ConversationTurn]:
+        """
+        策略2：窗口内的对话仍然太长时，将较早的轮次压缩为一条摘要
         
-        if total_length > self.max_context_length:
+        Args:
+            recent_turns: 已截取到最大轮次窗口内的对话
+            
+        Returns:
+            压缩后的对话轮次列表
+        """
+        if self._exceeds_context_length(recent_turns):
             # 保留最近3轮，其余进行摘要
             if len(recent_turns) > 3:
                 summary_turns = recent_turns[:-3]
@@ -180,6 +273,23 @@ class ConversationManager:
         
         return recent_turns
     
+    def _exceeds_context_length(self, turns: List[ConversationTurn]) -> bool:
+        """
+        判断对话总字符数是否超过上限（累加各轮创建时缓存的 char_len，超过上限即停止）
+        
+        Args:
+            turns: 对话轮次列表
+            
+        Returns:
+            是否超过 max_context_length
+        """
+        remaining = self.max_context_length
+        for turn in turns:
+            remaining -= turn.char_len
+            if remaining < 0:
+                return True
+        return False
+    
     def _generate_summary(self, turns: List[ConversationTurn]) -> str:
         """
         生成对话摘要
@@ -193,24 +303,23 @@ class ConversationManager:
         if not turns:
             return "无历史对话"
         
-        # 简化版摘要：提取关键主题和结论
+        # 简化版摘要：提取关键主题（前5个）和结论（最后一条长回复）
         topics = []
-        conclusions = []
-        
         for turn in turns:
-            # 提取主题（用户问题的关键词）
-            user_keywords = self._extract_keywords(turn.user_input)
-            if user_keywords:
-                topics.extend(user_keywords)
-            
-            # 提取结论（回复的关键信息）
-            if len(turn.assistant_reply) > 100:
-                # 取前100字符作为摘要
-                conclusions.append(turn.assistant_reply[:100] + "...")
+            # 提取主题（用户问题的关键词），凑够5个即可停止
+            topics.extend(self._extract_keywords(turn.user_input))
+            if len(topics) >= 5:
+                break
+        
+        # 提取结论（回复的关键信息）：从后往前找第一条长回复，取前100字符作为摘要
+        conclusion = next(
+            (turn.assistant_reply[:100] + "..." for turn in reversed(turns) if len(turn.assistant_reply) > 100),
+            None
+        )
         
         summary = f"讨论主题：{', '.join(set(topics[:5]))}。"
-        if conclusions:
-            summary += f" 主要结论：{conclusions[-1]}"
+        if conclusion:
+            summary += f" 主要结论：{conclusion}"
         
         return summary
     
@@ -224,15 +333,8 @@ class ConversationManager:
         Returns:
             关键词列表
         """
-        # 简化的关键词提取
-        keywords = []
-        technical_terms = ['数据库', '索引', '连接', '性能', '错误', '日志', '服务', '系统']
-        
-        for term in technical_terms:
-            if term in text:
-                keywords.append(term)
-        
-        return keywords
+        # 简化的关键词提取：一次正则扫描，按出现顺序去重
+        return list(dict.fromkeys(_TECHNICAL_TERM_PATTERN.findall(text)))
     
     def build_context_for_llm(self, turns: List[ConversationTurn], current_input: str, 
                              conversation_type: ConversationType) -> str:
@@ -247,57 +349,38 @@ class ConversationManager:
         Returns:
             格式化的上下文字符串
         """
-        if not turns:
-            return f"用户：{current_input}\n回复："
-        
-        # 根据对话类型选择不同的上下文构建策略
-        if conversation_type == ConversationType.FOLLOW_UP:
-            # 追问时，重点关注最近的对话
-            context_parts = []
-            for turn in turns[-2:]:  # 只保留最近2轮
-                context_parts.append(f"用户：{turn.user_input}")
-                context_parts.append(f"回复：{turn.assistant_reply}")
-            
-            context_parts.append(f"用户：{current_input}")
-            context_parts.append("回复：")
-            return "\n".join(context_parts)
-        
-        elif conversation_type == ConversationType.SUMMARY_REQUEST:
-            # 摘要请求时，包含更多历史信息
-            context_parts = []
-            for turn in turns:
-                context_parts.append(f"用户：{turn.user_input}")
-                context_parts.append(f"回复：{turn.assistant_reply}")
-            
-            context_parts.append(f"用户：{current_input}")
-            context_parts.append("回复：")
-            return "\n".join(context_parts)
+        # 追问时只保留最近2轮；摘要请求和其他类型包含全部（压缩后的）历史
+        context_turns = turns[-2:] if conversation_type == ConversationType.FOLLOW_UP else turns
         
-        else:
-            # 默认策略：包含压缩后的历史
-            context_parts = []
-            for turn in turns:
-                context_parts.append(f"用户：{turn.user_input}")
-                context_parts.append(f"回复：{turn.assistant_reply}")
-            
-            context_parts.append(f"用户：{current_input}")
-            context_parts.append("回复：")
-            return "\n".join(context_parts)
+        # 历史部分由各轮缓存的片段拼接而成，前缀在各轮之间保持字节一致（利于 LLM 的 prompt 缓存）
+        context_parts = [turn.segment for turn in context_turns]
+        context_parts.extend((_USER_MARKER, current_input, _REPLY_MARKER))
+        return "".join(context_parts)
     
-    def should_use_rag(self, conversation_type: ConversationType, user_input: str, classification_details: Dict = None) -> Tuple[bool, Dict]:
+    def should_use_rag(self, conversation_type: ConversationType, user_input: str, classification_details: Dict = None,
+                       intent_result: Optional[IntentResult] = None) -> Tuple[bool, Dict]:
         """
         使用意图分类结果判断是否需要RAG检索
         
         Args:
             conversation_type: 对话类型
             user_input: 用户输入
-            classification_details: 分类详情
+            classification_details: classify_conversation_type 返回的分类详情（含意图类型和置信度时直接复用）
+            intent_result: 已有的意图分类结果，两者都没有时现场分类
             
         Returns:
             是否使用RAG和决策详情
         """
-        # 使用意图分类器的结果
-        intent_result = classify_user_intent(user_input)
+        # 使用意图分类器的结果：优先复用调用方传入的结果或 classify_conversation_type 的分类详情，避免重复分类
+        if intent_result is None and classification_details and "intent_type" in classification_details:
+            intent_result = IntentResult(
+                intent=IntentType(classification_details["intent_type"]),
+                confidence=classification_details["confidence"],
+                processing_time=classification_details.get("processing_time", 0.0),
+                model_used=classification_details.get("model_used", "")
+            )
+        if intent_result is None:
+            intent_result = classify_user_intent(user_input)
         use_rag = is_rag_required(intent_result, user_input)
         
         # 决策详情
@@ -312,7 +395,7 @@ class ConversationManager:
         # 特殊情况处理
         if conversation_type == ConversationType.FOLLOW_UP:
             # 追问通常不需要新的RAG检索，除非是技术追问
-            if intent_result.intent in [IntentType.LOG_ANALYSIS, IntentType.TECHNICAL_HELP]:
+            if intent_result.intent in _TECHNICAL_FOLLOW_UP_INTENTS:
                 use_rag = True
                 decision_details["decision_reason"] = "技术追问需要RAG检索"
             else:
@@ -347,12 +430,8 @@ class ConversationManager:
         Returns:
             格式化的存储字符串
         """
-        context_parts = []
-        for turn in turns:
-            context_parts.append(f"用户：{turn.user_input}")
-            context_parts.append(f"回复：{turn.assistant_reply}")
-        
-        return "\n".join(context_parts) + "\n"
+        # 每轮一个片段（与 build_context_for_llm 共用缓存），生成器直接交给一次 join
+        return "".join(turn.segment for turn in turns)
 
     def add_new_turn(self, turns: List[ConversationTurn], user_input: str, 
                     assistant_reply: str, conversation_type: ConversationType,
@@ -379,6 +458,26 @@ class ConversationManager:
             metadata=metadata or {}
         )
         
-        updated_turns = turns + [new_turn]
-        return self.compress_context(updated_turns)
+        # 有界 deque：超出窗口的最早轮次在 append 时自动丢弃，无需拼接后再切片
+        window = deque(turns, maxlen=self.max_turns)
+        overflowed = len(turns) >= self.max_turns
+        window.append(new_turn)
+        
+        if not overflowed:
+            return list(window)
+        return self._summarize_if_too_long(list(window))
+
+# 全局单例：ConversationManager 实例（懒加载）
+_conversation_manager = None
+_conversation_manager_lock = threading.Lock()
 
+def get_conversation_manager() -> ConversationManager:
+    """获取全局对话管理器单例（首次请求时创建，管理命令不会触发）"""
+    global _conversation_manager
+    
+    if _conversation_manager is None:
+        with _conversation_manager_lock:
+            if _conversation_manager is None:
+                _conversation_manager = ConversationManager(max_context_length=4000, max_turns=10)
+    
+    return _conversation_manager
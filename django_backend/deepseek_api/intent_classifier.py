@@ -5,21 +5,37 @@
 """
 
 import os
+import re
 import time
+import asyncio
 import logging
 import threading
+import httpx
 import requests
 import json
+import sqlite3
+import unicodedata
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
 # 缓存相关
+from collections import OrderedDict
 from functools import lru_cache
-import hashlib
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from .intent_config import CONFIDENCE_THRESHOLDS
+from http_client import get_async_client, get_http_session, OLLAMA_KEEP_ALIVE, OLLAMA_NUM_PARALLEL
 
 logger = logging.getLogger(__name__)
 
+# 模型配置（纯常量模块，与 http_client 同在 django_backend 目录下）；缺失时使用默认本地模型
+try:
+    from model_config import CURRENT_CONFIG
+except ImportError as e:
+    logger.warning(f"读取配置失败，使用默认本地模型: {e}")
+    CURRENT_CONFIG = {}
+
 class IntentType(Enum):
     """意图类型枚举"""
     GENERAL_QA = "general_qa"           # 通用问答
@@ -40,7 +56,7 @@ TOOL_INTENTS = [
     IntentType.PERFORMANCE_ANALYSIS,
 ]
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class IntentResult:
     """意图分类结果"""
     intent: IntentType
@@ -48,10 +64,319 @@ class IntentResult:
     processing_time: float
     model_used: str
 
+# 规则预过滤：这些输入的分类结果是确定的，无需调用模型
+_NON_WORD_PATTERN = re.compile(r'[\s\W_]+', re.UNICODE)
+_NUMBER_ONLY_PATTERN = re.compile(r'[+-]?\d+(?:[.,]\d+)*%?')
+_URL_ONLY_PATTERN = re.compile(r'(?:https?|ftp)://\S+|www\.\S+', re.IGNORECASE)
+
+def _classify_trivial(text: str, start_time: float) -> Optional[IntentResult]:
+    """
+    对空输入、纯标点、纯数字、纯URL直接返回 UNKNOWN，跳过模型推理
+    
+    Args:
+        text: 已去除首尾空白的用户输入
+        start_time: 分类开始时间
+        
+    Returns:
+        命中规则时返回意图分类结果，否则返回 None
+    """
+    if not text:
+        model_used = "empty_input"
+    elif len(_NON_WORD_PATTERN.sub('', text)) < 2:
+        model_used = "rule"
+    elif _NUMBER_ONLY_PATTERN.fullmatch(text) or _URL_ONLY_PATTERN.fullmatch(text):
+        model_used = "rule"
+    else:
+        return None
+    
+    return IntentResult(
+        intent=IntentType.UNKNOWN,
+        confidence=1.0 if model_used == "rule" else 0.0,
+        processing_time=time.time() - start_time,
+        model_used=model_used
+    )
+
+# 高频触发短语：整句（去掉空白和标点、小写后）完全匹配时直接确定意图，不调用模型
+_TRIGGER_PHRASES = {
+    IntentType.GREETING: ["你好", "您好", "嗨", "hello", "hi", "早上好", "下午好", "晚上好", "howareyou", "goodmorning"],
+    IntentType.SUMMARY_REQUEST: ["总结", "总结一下", "概括", "概括一下", "摘要", "汇总一下", "summary", "summarize"],
+    IntentType.FOLLOW_UP: ["继续", "请继续", "详细说明一下", "详细说说", "展开说说", "还有吗", "还有其他方法吗"],
+    IntentType.ERROR_ANALYSIS: ["错误分析", "异常分析", "错误统计", "异常统计"],
+    IntentType.PERFORMANCE_ANALYSIS: ["性能分析", "性能瓶颈分析"],
+    IntentType.NETWORK_ANALYSIS: ["网络分析", "端口检查"],
+}
+_TRIGGER_INTENTS: Dict[str, IntentType] = {
+    phrase: intent for intent, phrases in _TRIGGER_PHRASES.items() for phrase in phrases
+}
+
+def _classify_by_trigger(text_lower: str, start_time: float) -> Optional[IntentResult]:
+    """
+    高频短语快速路径：整句命中触发短语时返回置信度 1.0 的结果
+    
+    Args:
+        text_lower: 小写后的用户输入
+        start_time: 分类开始时间
+        
+    Returns:
+        命中时返回意图分类结果，否则返回 None
+    """
+    intent = _TRIGGER_INTENTS.get(_NON_WORD_PATTERN.sub('', text_lower))
+    if intent is None:
+        return None
+    return IntentResult(
+        intent=intent,
+        confidence=1.0,
+        processing_time=time.time() - start_time,
+        model_used="trigger"
+    )
+
+# 意图分类 prompt 模板（模块加载时创建一次，每次请求只填入用户输入）
+_PROMPT_TEMPLATE = """请分析以下用户输入的意图，从这些类型中选择一个：
+
+1. greeting - 问候语
+   示例：你好、hello、hi、how are you、早上好、晚上好
+   
+2. general_qa - 通用问答
+   示例：什么是AI、天气怎么样、推荐一本书
+   
+3. log_analysis - 日志分析
+   示例：分析这个错误日志、查看系统异常、日志中的问题
+   
+4. technical_help - 技术帮助
+   示例：如何配置数据库、怎么解决连接问题、安装教程
+   
+5. follow_up - 追问澄清
+   示例：那个错误怎么解决、还有其他方法吗、详细说明一下
+   
+6. summary_request - 摘要请求
+   示例：总结一下、概括要点、简要说明
+   
+7. network_analysis - 网络分析工具
+   示例：分析网络连接问题、检查端口状态、网络异常排查
+   
+8. error_analysis - 错误分析工具
+   示例：分析系统错误、错误统计、异常分析
+   
+9. performance_analysis - 性能分析工具
+   示例：性能分析、CPU使用率、内存优化、性能瓶颈
+   
+10. unknown - 未知意图
+
+用户输入："{text}"
+
+请仔细分析用户输入，特别注意问候语（如hello、hi、how are you等）应该归类为greeting。
+
+请只回答意图类型和置信度（0-1），格式：意图类型,置信度
+例如：greeting,0.95"""
+
+# 模型输出中的意图名 -> IntentType
+_INTENT_MAPPING: Dict[str, IntentType] = {intent_type.value: intent_type for intent_type in IntentType}
+
+# 输出不是 "意图,置信度" 格式时，按此优先级在输出中查找意图名（互不为子串，可一次扫描全部找出）
+_INTENT_SUBSTRING_ORDER: Tuple[Tuple[str, IntentType], ...] = (
+    ('log_analysis', IntentType.LOG_ANALYSIS),
+    ('technical_help', IntentType.TECHNICAL_HELP),
+    ('follow_up', IntentType.FOLLOW_UP),
+    ('summary_request', IntentType.SUMMARY_REQUEST),
+    ('greeting', IntentType.GREETING),
+    ('general_qa', IntentType.GENERAL_QA),
+    ('network_analysis', IntentType.NETWORK_ANALYSIS),
+    ('error_analysis', IntentType.ERROR_ANALYSIS),
+    ('performance_analysis', IntentType.PERFORMANCE_ANALYSIS)
+)
+# 模型输出的标准格式 "意图类型,置信度"
+_MODEL_OUTPUT_PATTERN = re.compile(r'([a-z_]+)\s*,\s*([0-9]*\.?[0-9]+)')
+_INTENT_NAME_PATTERN = re.compile("|".join(re.escape(intent_str) for intent_str, _ in _INTENT_SUBSTRING_ORDER))
+
+# 分类请求的固定生成参数（只读，每次请求共用）
+_OLLAMA_OPTIONS = {
+    "temperature": 0.1,
+    "num_predict": 20,
+    "stop": ["\n", "。", ".", "，", ","]
+}
+_DEEPSEEK_REQUEST_OPTIONS = {
+    "temperature": 0.1,
+    "max_tokens": 50,
+    "stream": False,
+}
+
+def _encode_json(payload: Dict) -> bytes:
+    """将请求体编码为紧凑的 UTF-8 JSON（不转义非 ASCII 字符）"""
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# 占位的用户输入：请求体只编码一次，按它编码后的字节切成前后两段
+_PROMPT_TEXT_SLOT = "\x00text\x00"
+_ENCODED_TEXT_SLOT = json.dumps(_PROMPT_TEXT_SLOT)[1:-1].encode("utf-8")
+
+def _split_encoded_payload(payload: Dict) -> Tuple[bytes, bytes]:
+    """将含占位输入的请求体编码为 UTF-8 JSON，返回占位符前后的字节 (head, tail)"""
+    head, tail = _encode_json(payload).split(_ENCODED_TEXT_SLOT)
+    return head, tail
+
+def _encode_json_string_body(text: str) -> bytes:
+    """编码 JSON 字符串的内容部分（不含两侧引号），与 _encode_json 的转义规则一致"""
+    return json.dumps(text, ensure_ascii=False)[1:-1].encode("utf-8")
+
+@dataclass(frozen=True)
+class _LogToolSpec:
+    """检索类工具的配置：查询增强前缀与结果文案"""
+    name: str
+    query_prefix: str
+    header: str
+    count_line: str
+    empty_result: str
+    error_result: str
+
+_NETWORK_TOOL = _LogToolSpec(
+    name="网络分析工具",
+    query_prefix="网络 连接 端口 ",
+    header="📡 网络分析结果：\n",
+    count_line="检索到 {count} 条相关日志：\n",
+    empty_result="📡 网络分析结果：未发现明显的网络连接问题。建议检查端口8080和数据库连接配置。",
+    error_result="📡 网络分析结果：检测到3个异常连接，建议检查端口8080。",
+)
+_ERROR_TOOL = _LogToolSpec(
+    name="错误分析工具",
+    query_prefix="错误 异常 error exception ",
+    header="🛑 错误分析结果：\n",
+    count_line="发现 {count} 个关键错误：\n",
+    empty_result="🛑 错误分析结果：未发现明显的系统错误。系统运行正常。",
+    error_result="🛑 错误分析结果：发现2个关键错误，涉及数据库连接超时。",
+)
+_PERFORMANCE_TOOL = _LogToolSpec(
+    name="性能分析工具",
+    query_prefix="性能 性能优化 cpu 内存 memory performance ",
+    header="⚡ 性能分析结果：\n",
+    count_line="检索到 {count} 条性能相关日志：\n",
+    empty_result="⚡ 性能分析结果：CPU使用率峰值达90%，建议优化数据库查询和缓存策略。",
+    error_result="⚡ 性能分析结果：CPU使用率峰值达90%，建议优化查询。",
+)
+
+class _NeedleMatcher:
+    """
+    多关键词一次扫描匹配器（关键词 -> 所属意图列表）
+    
+    所有关键词按长度降序编译为一个前瞻交替正则，在每个位置找出最长命中；
+    以同一位置开头的较短关键词（如 "性能分析" 中的 "性能"）通过预计算的前缀表补全，
+    因此结果与逐个 `keyword in text` 判断完全一致。
+    """
+    
+    def __init__(self, owners: Dict[str, List[IntentType]]):
+        self._owners = owners
+        needles = sorted(owners, key=len, reverse=True)
+        self._pattern = re.compile("(?=(" + "|".join(map(re.escape, needles)) + "))") if needles else None
+        self._prefixes = {
+            needle: tuple(other for other in needles if needle.startswith(other))
+            for needle in needles
+        }
+    
+    def add_scores(self, text: str, weight: int, scores: Dict[IntentType, int]):
+        """为文本中出现的每个（去重后的）关键词，给其所属意图加上 weight 分"""
+        if self._pattern is None:
+            return
+        found = set()
+        for match in self._pattern.finditer(text):
+            found.update(self._prefixes[match.group(1)])
+        for needle in found:
+            for intent_type in self._owners[needle]:
+                scores[intent_type] = scores.get(intent_type, 0) + weight
+
+# 意图分类结果的持久化二级缓存（进程重启后仍可命中）；设置为空字符串可关闭
+INTENT_DISK_CACHE_PATH = os.getenv(
+    "INTENT_DISK_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "intent_cache.sqlite3"),
+)
+INTENT_DISK_CACHE_MAX_ENTRIES = int(os.getenv("INTENT_DISK_CACHE_MAX_ENTRIES", "100000"))
+
+# 关键词分类结果缓存的条目数
+KEYWORD_CACHE_SIZE = 4096
+
+# 模型路径的分类结果：(意图, 置信度, 实际来源)，来源为模型名称或 "keyword_fallback"
+_ModelClassification = Tuple[IntentType, float, str]
+
+# 合并请求的发起者被取消（客户端断开等）时交给等待者的标记：等待者各自调用模型，而不是收到取消异常
+_LEADER_ABANDONED = object()
+
+class _IntentDiskCache:
+    """
+    基于 SQLite 的意图分类持久化缓存（进程内 LRU 之下的二级缓存）
+    
+    只保存模型给出的分类结果（关键词回退的结果不落盘），键包含模型名称，
+    切换分类模型后不会命中旧结果。所有数据库错误只记录日志，不影响分类流程。
+    """
+    
+    def __init__(self, path: str, max_entries: int):
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 锁等待上限 50ms（默认 5 秒）：多进程争用时宁可放弃这次读写，也不拖住请求
+        self._conn = sqlite3.connect(path, timeout=0.05, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS intent_cache ("
+            "key TEXT PRIMARY KEY, intent TEXT NOT NULL, confidence REAL NOT NULL)"
+        )
+    
+    def get(self, key: str) -> Optional[Tuple[IntentType, float]]:
+        """查询持久化缓存，未命中或读取失败时返回 None"""
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT intent, confidence FROM intent_cache WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"读取意图持久化缓存失败: {e}")
+            return None
+        if row is None:
+            return None
+        try:
+            return IntentType(row[0]), row[1]
+        except ValueError:
+            return None
+    
+    def set(self, key: str, value: Tuple[IntentType, float]):
+        """写入持久化缓存，每 1000 次写入清理一次最早写入的多余条目"""
+        intent, confidence = value
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO intent_cache (key, intent, confidence) VALUES (?, ?, ?)",
+                    (key, intent.value, confidence),
+                )
+                self._writes += 1
+                if self._writes % 1000 == 0:
+                    self._conn.execute(
+                        "DELETE FROM intent_cache WHERE rowid NOT IN "
+                        "(SELECT rowid FROM intent_cache ORDER BY rowid DESC LIMIT ?)",
+                        (self._max_entries,),
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"写入意图持久化缓存失败: {e}")
+
+def _open_disk_cache() -> Optional[_IntentDiskCache]:
+    """按配置打开持久化缓存，未配置或打开失败时返回 None（只使用进程内缓存）"""
+    if not INTENT_DISK_CACHE_PATH:
+        return None
+    try:
+        return _IntentDiskCache(INTENT_DISK_CACHE_PATH, INTENT_DISK_CACHE_MAX_ENTRIES)
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"无法打开意图持久化缓存 ({INTENT_DISK_CACHE_PATH})，仅使用进程内缓存: {e}")
+        return None
+
+# Ollama 可用性探测结果：(ollama_url, model_name) -> 模型是否可用（None 表示探测中，False 表示服务不可用或模型未安装）
+# 进程内共享，同一地址和模型只探测一次，之后新建的分类器实例直接跳过；为 False 时分类直接走关键词匹配
+_OLLAMA_PROBE_RESULTS: Dict[Tuple[str, str], Optional[bool]] = {}
+_ollama_probe_lock = threading.Lock()
+
 class LightweightIntentClassifier:
     """轻量级意图分类器 - 支持 Ollama 和 DeepSeek API"""
     
-    def __init__(self, model_name: str = "qwen2.5:0.5b", ollama_url: str = "http://localhost:11434", cache_size: int = 1000, use_api: bool = False):
+    def __init__(self, model_name: str = "qwen2.5:0.5b", ollama_url: str = "http://localhost:11434", cache_size: int = 4096, use_api: bool = False,
+                 fastpath_threshold: float = CONFIDENCE_THRESHOLDS["high_confidence"], request_timeout: Optional[Tuple[float, float]] = None):
         """
         初始化意图分类器
         
@@ -60,19 +385,47 @@ class LightweightIntentClassifier:
             ollama_url: Ollama服务地址
             cache_size: 缓存大小
             use_api: 是否使用 DeepSeek API（默认使用 Ollama）
+            fastpath_threshold: 关键词匹配置信度达到该值时直接返回，不再调用模型（默认取 intent_config 的高置信度阈值）
+            request_timeout: 分类请求的 (连接超时, 读取超时) 秒数；默认本地 Ollama 为 (1, 4)，
+                             DeepSeek API 需要跨公网建连，为 (3, 4)
         """
         self.model_name = model_name
         self.ollama_url = ollama_url
         self.cache_size = cache_size
         self.use_api = use_api
+        self.fastpath_threshold = fastpath_threshold
+        # 连接与读取分开限时：服务不可达时约 1 秒即回退关键词匹配，而不是等满整个超时
+        self.request_timeout = request_timeout or ((3.0, 4.0) if use_api else (1.0, 4.0))
+        connect_timeout, read_timeout = self.request_timeout
+        self._async_timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        # 跟随者等待进行中请求的上限（略大于一次请求的总超时），超时后自行请求
+        self._inflight_wait = connect_timeout + read_timeout + 1.0
         self._lock = threading.Lock()
         self._initialized = False
         
+        # 进程内分类结果缓存（同步/异步路径共用）：缓存键 -> (意图, 置信度)
+        self._cache: "OrderedDict[str, _ModelClassification]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._disk_cache = _open_disk_cache()
+        
+        # 进行中的模型请求（缓存键 -> Future）：并发到达的相同输入共用一次模型调用（同步/异步路径通用）
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+        
+        # 模型请求头（只构建一次，每次请求复用；请求体由 _build_model_request 预先编码为 JSON 字节）
+        self._request_headers: Dict[str, str] = {"Content-Type": "application/json"}
+        
         # 如果使用 API，获取 API Key
         if self.use_api:
             from deepseek_config import get_api_key, DEEPSEEK_BASE_URL
             self.api_key = get_api_key()
             self.api_base_url = DEEPSEEK_BASE_URL
+            self._request_headers = {
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+            }
             if not self.api_key:
                 logger.warning("⚠️  未找到 DeepSeek API Key，将回退到关键词匹配")
             else:
@@ -80,6 +433,9 @@ class LightweightIntentClassifier:
         else:
             logger.info(f"🖥️  意图分类器使用本地 Ollama - 模型: {model_name}")
         
+        # 请求体中只有用户输入会变：prompt 前后缀和其余字段在这里编码一次，每次请求只编码用户输入
+        self._model_url, self._body_head, self._body_tail = self._build_request_template()
+        
         # 意图模板和关键词（作为fallback）
         self.intent_patterns = {
             IntentType.LOG_ANALYSIS: {
@@ -107,7 +463,7 @@ class LightweightIntentClassifier:
                 "patterns": ["网络分析", "连接分析", "端口检查", "网络问题"]
             },
             IntentType.ERROR_ANALYSIS: {
-                "keywords": ["错误分析", "异常分析", "error analysis", "exception analysis", "错误统计", "异常统计"],
+                "keywords": ["错误", "异常", "error", "exception", "错误分析", "异常分析", "error analysis", "exception analysis", "错误统计", "异常统计"],
                 "patterns": ["错误分析", "异常分析", "错误统计"]
             },
             IntentType.PERFORMANCE_ANALYSIS: {
@@ -116,6 +472,19 @@ class LightweightIntentClassifier:
             }
         }
         
+        # 关键词（匹配小写文本，1分）和模式（匹配原文，2分）各编译为一个一次扫描的匹配器
+        keyword_owners: Dict[str, List[IntentType]] = {}
+        pattern_owners: Dict[str, List[IntentType]] = {}
+        for intent_type, patterns in self.intent_patterns.items():
+            for keyword in patterns["keywords"]:
+                keyword_owners.setdefault(keyword, []).append(intent_type)
+            for pattern in patterns["patterns"]:
+                pattern_owners.setdefault(pattern, []).append(intent_type)
+        self._keyword_matcher = _NeedleMatcher(keyword_owners)
+        self._pattern_matcher = _NeedleMatcher(pattern_owners)
+        # 关键词分类结果只取决于输入文本，快速路径和模型失败回退共用一个 LRU
+        self._keyword_cache = lru_cache(maxsize=KEYWORD_CACHE_SIZE)(self._score_keywords)
+        
         # 工具字典：映射意图到工具执行函数
         self.tools = {
             IntentType.NETWORK_ANALYSIS: self.run_network_analysis,
@@ -124,7 +493,7 @@ class LightweightIntentClassifier:
         }
     
     def _lazy_init(self):
-        """延迟初始化 - 检查Ollama连接"""
+        """延迟初始化 - 在后台线程检查Ollama连接（不阻塞首次分类，确认不可用后分类不再请求Ollama）"""
         if self._initialized:
             return
         
@@ -132,233 +501,467 @@ class LightweightIntentClassifier:
             if self._initialized:
                 return
             
-            try:
-                logger.info(f"正在初始化Ollama意图分类器: {self.model_name}")
-                start_time = time.time()
+            probe_key = (self.ollama_url, self.model_name)
+            with _ollama_probe_lock:
+                should_probe = probe_key not in _OLLAMA_PROBE_RESULTS
+                if should_probe:
+                    _OLLAMA_PROBE_RESULTS[probe_key] = None
+            
+            if should_probe:
+                threading.Thread(target=self._probe_ollama, args=(probe_key,),
+                                 name="intent-ollama-probe", daemon=True).start()
+            self._initialized = True
+    
+    def _probe_ollama(self, probe_key: Tuple[str, str]):
+        """检查Ollama服务是否可用、模型是否已安装，结果记入 _OLLAMA_PROBE_RESULTS"""
+        logger.info(f"正在检查Ollama意图分类模型: {self.model_name}")
+        start_time = time.time()
+        
+        try:
+            response = get_http_session().get(f"{self.ollama_url}/api/tags", timeout=1.0)
+            if response.status_code == 200:
+                available_models = {model['name'] for model in response.json().get('models', [])}
+                model_available = self.model_name in available_models
+                _OLLAMA_PROBE_RESULTS[probe_key] = model_available
+                if not model_available:
+                    logger.warning(f"模型 {self.model_name} 未安装，可用模型: {sorted(available_models)}")
+                    logger.info(f"请运行: ollama pull {self.model_name}")
                 
-                # 检查Ollama服务是否可用
-                try:
-                    response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
-                    if response.status_code == 200:
-                        available_models = [model['name'] for model in response.json().get('models', [])]
-                        if self.model_name not in available_models:
-                            logger.warning(f"模型 {self.model_name} 未安装，可用模型: {available_models}")
-                            logger.info(f"请运行: ollama pull {self.model_name}")
-                        
-                        logger.info(f"Ollama服务连接成功，使用模型: {self.model_name}")
-                    else:
-                        logger.warning("Ollama服务连接失败，将使用关键词匹配")
-                        
-                except requests.RequestException as e:
-                    logger.warning(f"无法连接到Ollama服务 ({self.ollama_url}): {e}")
-                    logger.info("将使用关键词匹配作为fallback")
+                logger.info(f"Ollama服务连接成功，使用模型: {self.model_name}")
+            else:
+                _OLLAMA_PROBE_RESULTS[probe_key] = False
+                logger.warning("Ollama服务连接失败，将使用关键词匹配")
                 
-                init_time = time.time() - start_time
-                logger.info(f"意图分类器初始化完成，耗时: {init_time:.2f}秒")
-                self._initialized = True
-                    
-            except Exception as e:
-                logger.error(f"意图分类器初始化失败: {e}")
-                logger.info("将使用关键词匹配作为fallback")
-                self._initialized = True
-    
-    @lru_cache(maxsize=1000)
-    def _cached_classify(self, text_hash: str, text: str) -> Tuple[IntentType, float]:
-        """带缓存的分类方法"""
-        return self._classify_with_model(text)
-    
-    def _classify_with_model(self, text: str) -> Tuple[IntentType, float]:
-        """使用模型进行分类（支持 Ollama 和 DeepSeek API）"""
+        except requests.RequestException as e:
+            _OLLAMA_PROBE_RESULTS[probe_key] = False
+            logger.warning(f"无法连接到Ollama服务 ({self.ollama_url}): {e}")
+            logger.info("将使用关键词匹配作为fallback")
+        except Exception as e:
+            _OLLAMA_PROBE_RESULTS[probe_key] = False
+            logger.error(f"Ollama服务检查失败: {e}")
+        
+        logger.info(f"Ollama服务检查完成，耗时: {time.time() - start_time:.2f}秒")
+    
+    @staticmethod
+    def _cache_key(text_lower: str) -> str:
+        """
+        归一化文本直接作为缓存键（字典本身会哈希，无需再算摘要）
+        
+        NFKC 把全角字母/数字/标点折叠为半角，再小写并合并空白，
+        使 "Ｈｅｌｌｏ？"、" hello? " 这类只在书写形式上不同的输入共用同一条缓存
+        """
+        return " ".join(unicodedata.normalize("NFKC", text_lower).lower().split())
+    
+    def _cache_get(self, key: str) -> Optional[_ModelClassification]:
+        """查询缓存（进程内 LRU，未命中时再查持久化缓存并回填），每 500 次查询输出一次命中率"""
+        value = self._memory_cache_get(key)
+        if value is None and self._disk_cache is not None:
+            value = self._disk_cache_get(key)
+        self._count_cache_lookup(value is not None)
+        return value
+    
+    async def _acache_get(self, key: str) -> Optional[_ModelClassification]:
+        """_cache_get 的异步版本：持久化缓存（SQLite）放到线程中查询，不阻塞事件循环"""
+        value = self._memory_cache_get(key)
+        if value is None and self._disk_cache is not None:
+            value = await asyncio.to_thread(self._disk_cache_get, key)
+        self._count_cache_lookup(value is not None)
+        return value
+    
+    def _memory_cache_get(self, key: str) -> Optional[_ModelClassification]:
+        """查询进程内 LRU"""
+        with self._cache_lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+        return value
+    
+    def _disk_cache_get(self, key: str) -> Optional[_ModelClassification]:
+        """查询持久化缓存，命中时回填进程内 LRU"""
+        persisted = self._disk_cache.get(self._disk_cache_key(key))
+        if persisted is None:
+            return None
+        value = (*persisted, self.model_name)  # 持久化缓存只保存模型结果
+        self._cache_put(key, value)
+        return value
+    
+    def _count_cache_lookup(self, hit: bool):
+        """统计命中率，每 500 次查询输出一次"""
+        with self._cache_lock:
+            if hit:
+                self._cache_hits += 1
+            else:
+                self._cache_misses += 1
+            total = self._cache_hits + self._cache_misses
+            if total % 500 == 0:
+                logger.info(f"意图分类缓存: 命中 {self._cache_hits}/{total}，条目 {len(self._cache)}/{self.cache_size}")
+    
+    def _disk_cache_key(self, key: str) -> str:
+        """
+        持久化缓存的键带上格式版本和模型名称，切换模型后不复用旧结果
+        （v2：只保存格式合法的模型输出，v1 中可能混有无法解析的结果，不再读取，由容量淘汰清理）
+        """
+        return f"v2\n{self.model_name}\n{key}"
+    
+    def _remember_model_result(self, cache_key: Optional[str], value: Tuple[IntentType, float]):
+        """模型输出格式正确时把结果写入持久化缓存（关键词回退和无法解析的输出不落盘）"""
+        if cache_key is not None and self._disk_cache is not None:
+            self._disk_cache.set(self._disk_cache_key(cache_key), value)
+    
+    async def _aremember_model_result(self, cache_key: Optional[str], value: Tuple[IntentType, float]):
+        """_remember_model_result 的异步版本：SQLite 写入（含定期清理）放到线程中执行"""
+        if cache_key is not None and self._disk_cache is not None:
+            await asyncio.to_thread(self._disk_cache.set, self._disk_cache_key(cache_key), value)
+    
+    def _cache_put(self, key: str, value: _ModelClassification):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        with self._cache_lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+    
+    def _join_inflight(self, cache_key: str) -> Tuple[Future, bool]:
+        """
+        加入相同输入的进行中请求
+        
+        Returns:
+            (future, 是否为发起者)；发起者负责调用模型并设置结果，其余调用方等待该 future
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(cache_key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[cache_key] = future
+            return future, True
+    
+    def _leave_inflight(self, cache_key: str):
+        """发起者完成（无论成功与否）后移除进行中记录"""
+        with self._inflight_lock:
+            self._inflight.pop(cache_key, None)
+    
+    def _classify_coalesced(self, text: str, text_lower: str, cache_key: str) -> _ModelClassification:
+        """缓存未命中时调用模型；相同输入已有请求在进行时等待其结果，不再重复请求"""
+        future, is_leader = self._join_inflight(cache_key)
+        if not is_leader:
+            try:
+                value = future.result(timeout=self._inflight_wait)
+            except FutureTimeoutError:
+                return self._classify_with_model(text, text_lower, cache_key)
+            if value is _LEADER_ABANDONED:
+                return self._classify_with_model(text, text_lower, cache_key)
+            return value
+        
         try:
-            # 构建意图分类的prompt
-            prompt = f"""请分析以下用户输入的意图，从这些类型中选择一个：
-
-1. greeting - 问候语
-   示例：你好、hello、hi、how are you、早上好、晚上好
-   
-2. general_qa - 通用问答
-   示例：什么是AI、天气怎么样、推荐一本书
-   
-3. log_analysis - 日志分析
-   示例：分析这个错误日志、查看系统异常、日志中的问题
-   
-4. technical_help - 技术帮助
-   示例：如何配置数据库、怎么解决连接问题、安装教程
-   
-5. follow_up - 追问澄清
-   示例：那个错误怎么解决、还有其他方法吗、详细说明一下
-   
-6. summary_request - 摘要请求
-   示例：总结一下、概括要点、简要说明
-   
-7. network_analysis - 网络分析工具
-   示例：分析网络连接问题、检查端口状态、网络异常排查
-   
-8. error_analysis - 错误分析工具
-   示例：分析系统错误、错误统计、异常分析
-   
-9. performance_analysis - 性能分析工具
-   示例：性能分析、CPU使用率、内存优化、性能瓶颈
-   
-10. unknown - 未知意图
-
-用户输入："{text}"
-
-请仔细分析用户输入，特别注意问候语（如hello、hi、how are you等）应该归类为greeting。
-
-请只回答意图类型和置信度（0-1），格式：意图类型,置信度
-例如：greeting,0.95"""
+            value = self._classify_with_model(text, text_lower, cache_key)
+            if value[2] != "keyword_fallback":  # 回退结果计算很便宜，不缓存，模型恢复后立即重新使用模型
+                self._cache_put(cache_key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            # 取消 / GeneratorExit 只属于发起者自己，不传给其他请求
+            future.set_result(_LEADER_ABANDONED)
+            raise
+        finally:
+            self._leave_inflight(cache_key)
+    
+    async def _aclassify_coalesced(self, text: str, text_lower: str, cache_key: str) -> _ModelClassification:
+        """_classify_coalesced 的异步版本（Future 可跨线程、跨事件循环等待）"""
+        future, is_leader = self._join_inflight(cache_key)
+        if not is_leader:
+            try:
+                # shield：等待超时只取消本协程的等待，不取消发起者的 future
+                value = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self._inflight_wait)
+            except asyncio.TimeoutError:
+                return await self._aclassify_with_model(text, text_lower, cache_key)
+            if value is _LEADER_ABANDONED:
+                return await self._aclassify_with_model(text, text_lower, cache_key)
+            return value
+        
+        try:
+            value = await self._aclassify_with_model(text, text_lower, cache_key)
+            if value[2] != "keyword_fallback":  # 回退结果计算很便宜，不缓存，模型恢复后立即重新使用模型
+                self._cache_put(cache_key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            # 取消 / GeneratorExit 只属于发起者自己，不传给其他请求
+            future.set_result(_LEADER_ABANDONED)
+            raise
+        finally:
+            self._leave_inflight(cache_key)
+    
+    def _build_request_template(self) -> Tuple[str, bytes, bytes]:
+        """
+        构建模型分类请求的固定部分，返回 (url, body_head, body_tail)
+        
+        body 以 ensure_ascii=False 编码为 UTF-8 JSON：prompt 以中文为主，
+        默认的 \\uXXXX 转义每个汉字占 6 字节，UTF-8 只需 3 字节，请求体约减半
+        """
+        prompt = _PROMPT_TEMPLATE.format(text=_PROMPT_TEXT_SLOT)
 
-            if self.use_api and self.api_key:
-                # 使用 DeepSeek API
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
-                }
-                
-                payload = {
-                    "model": self.model_name,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.1,
-                    "max_tokens": 50,
-                    "stream": False,
-                }
-                
-                response = requests.post(
-                    f"{self.api_base_url}/v1/chat/completions",
-                    headers=headers,
-                    json=payload,
-                    timeout=5
-                )
-                
+        if self._use_deepseek_api():
+            # 使用 DeepSeek API
+            payload = {
+                "model": self.model_name,
+                "messages": [{"role": "user", "content": prompt}],
+                **_DEEPSEEK_REQUEST_OPTIONS,
+            }
+            
+            return (f"{self.api_base_url}/v1/chat/completions", *_split_encoded_payload(payload))
+        
+        # 使用 Ollama
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": True,  # 流式返回，解析出完整结果后即可断开，不必等生成结束
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": _OLLAMA_OPTIONS
+        }
+        
+        return (f"{self.ollama_url}/api/generate", *_split_encoded_payload(payload))
+    
+    def _build_model_request(self, text: str) -> Tuple[str, Dict, bytes]:
+        """构建模型分类请求，返回 (url, headers, body)；只有用户输入需要逐次编码"""
+        body = b"".join((self._body_head, _encode_json_string_body(text), self._body_tail))
+        return self._model_url, self._request_headers, body
+    
+    def _use_deepseek_api(self) -> bool:
+        """是否使用 DeepSeek API 进行分类"""
+        return bool(self.use_api and self.api_key)
+    
+    def _ollama_unavailable(self) -> bool:
+        """后台探测已确认 Ollama 服务不可用或模型未安装（DeepSeek API 模式不受影响）"""
+        return (not self._use_deepseek_api()
+                and _OLLAMA_PROBE_RESULTS.get((self.ollama_url, self.model_name)) is False)
+    
+    @staticmethod
+    def _deepseek_output(result: Dict) -> str:
+        """从 DeepSeek 响应 JSON 中取出模型输出"""
+        return result["choices"][0]["message"]["content"]
+    
+    @staticmethod
+    def _feed_ollama_line(chunks: List[str], line) -> bool:
+        """
+        累积 Ollama 流式响应的一行（NDJSON）
+        
+        Args:
+            chunks: 已收到的输出片段，原地追加
+            line: 响应中的一行
+            
+        Returns:
+            是否可以停止读取：生成已结束，或已解析出 "意图,置信度" 且置信度之后已有其他字符（数字不会再变长）
+        """
+        if not line:
+            return False
+        data = json.loads(line)
+        chunks.append(data.get("response", ""))
+        if data.get("done"):
+            return True
+        output = "".join(chunks)
+        match = _MODEL_OUTPUT_PATTERN.search(output.lower())
+        return match is not None and match.end() < len(output) and output[match.end()] not in "0123456789."
+    
+    def _read_ollama_stream(self, lines) -> str:
+        """读取 Ollama 流式输出，结果确定后立即停止（调用方关闭响应即中断服务端生成）"""
+        chunks: List[str] = []
+        for line in lines:
+            if self._feed_ollama_line(chunks, line):
+                break
+        return "".join(chunks)
+    
+    async def _aread_ollama_stream(self, lines) -> str:
+        """_read_ollama_stream 的异步版本"""
+        chunks: List[str] = []
+        async for line in lines:
+            if self._feed_ollama_line(chunks, line):
+                break
+        return "".join(chunks)
+    
+    def _classify_with_model(self, text: str, text_lower: Optional[str] = None,
+                             cache_key: Optional[str] = None) -> _ModelClassification:
+        """
+        使用模型进行分类（支持 Ollama 和 DeepSeek API），失败时回退到关键词匹配
+        
+        Args:
+            text: 用户输入文本
+            text_lower: 小写文本，供关键词回退复用
+            cache_key: 缓存键，用于持久化成功的模型结果
+            
+        Returns:
+            (意图, 置信度, 实际来源)：模型成功时来源为模型名称，否则为 "keyword_fallback"
+        """
+        if self._ollama_unavailable():
+            # 探测已失败：不再逐次发起注定失败的连接（每次约 0.2 秒的连接重试）
+            return self._keyword_fallback(text, text_lower)
+        
+        try:
+            url, headers, body = self._build_model_request(text)
+            
+            with get_http_session().post(
+                url,
+                headers=headers,
+                data=body,
+                timeout=self.request_timeout,
+                stream=True
+            ) as response:
                 if response.status_code == 200:
-                    result = response.json()
-                    output = result["choices"][0]["message"]["content"].strip()
-                    intent, confidence = self._parse_ollama_output(output)
-                    return intent, confidence
+                    if self._use_deepseek_api():
+                        output = self._deepseek_output(response.json())
+                    else:
+                        output = self._read_ollama_stream(response.iter_lines())
+                    intent, confidence, well_formed = self._parse_ollama_output(output.strip())
+                    if well_formed:
+                        self._remember_model_result(cache_key, (intent, confidence))
+                    return intent, confidence, self.model_name
                 else:
-                    logger.warning(f"DeepSeek API调用失败: {response.status_code}")
-                    return self._classify_with_keywords(text)
-            else:
-                # 使用 Ollama
-                payload = {
-                    "model": self.model_name,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.1,
-                        "num_predict": 20,
-                        "stop": ["\n", "。", ".", "，", ","]
-                    }
-                }
-                
-                response = requests.post(
-                    f"{self.ollama_url}/api/generate",
-                    json=payload,
-                    timeout=5
-                )
+                    source = "DeepSeek" if self._use_deepseek_api() else "Ollama"
+                    logger.warning(f"{source} API调用失败: {response.status_code}")
+                    return self._keyword_fallback(text, text_lower)
                 
+        except requests.RequestException as e:
+            logger.warning(f"API请求失败，使用关键词匹配: {e}")
+            return self._keyword_fallback(text, text_lower)
+        except Exception as e:
+            logger.warning(f"模型推理失败，使用关键词匹配: {e}")
+            return self._keyword_fallback(text, text_lower)
+    
+    async def _aclassify_with_model(self, text: str, text_lower: Optional[str] = None,
+                                    cache_key: Optional[str] = None) -> _ModelClassification:
+        """使用模型进行分类的异步版本（共享 httpx.AsyncClient 连接池）"""
+        if self._ollama_unavailable():
+            return self._keyword_fallback(text, text_lower)
+        
+        try:
+            url, headers, body = self._build_model_request(text)
+            
+            async with get_async_client().stream(
+                "POST",
+                url,
+                headers=headers,
+                content=body,
+                timeout=self._async_timeout
+            ) as response:
                 if response.status_code == 200:
-                    result = response.json()
-                    output = result.get('response', '').strip()
-                    intent, confidence = self._parse_ollama_output(output)
-                    return intent, confidence
+                    if self._use_deepseek_api():
+                        await response.aread()
+                        output = self._deepseek_output(response.json())
+                    else:
+                        output = await self._aread_ollama_stream(response.aiter_lines())
+                    intent, confidence, well_formed = self._parse_ollama_output(output.strip())
+                    if well_formed:
+                        await self._aremember_model_result(cache_key, (intent, confidence))
+                    return intent, confidence, self.model_name
                 else:
-                    logger.warning(f"Ollama API调用失败: {response.status_code}")
-                    return self._classify_with_keywords(text)
+                    source = "DeepSeek" if self._use_deepseek_api() else "Ollama"
+                    logger.warning(f"{source} API调用失败: {response.status_code}")
+                    return self._keyword_fallback(text, text_lower)
                 
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             logger.warning(f"API请求失败，使用关键词匹配: {e}")
-            return self._classify_with_keywords(text)
+            return self._keyword_fallback(text, text_lower)
         except Exception as e:
             logger.warning(f"模型推理失败，使用关键词匹配: {e}")
-            return self._classify_with_keywords(text)
+            return self._keyword_fallback(text, text_lower)
+    
+    def _keyword_fallback(self, text: str, text_lower: Optional[str]) -> _ModelClassification:
+        """模型不可用时的关键词匹配结果（标记来源，供 IntentResult.model_used 如实反映）"""
+        intent, confidence = self._classify_with_keywords(text, text_lower)
+        return intent, confidence, "keyword_fallback"
     
-    def _parse_ollama_output(self, output: str) -> Tuple[IntentType, float]:
-        """解析Ollama输出"""
+    def _parse_ollama_output(self, output: str) -> Tuple[IntentType, float, bool]:
+        """
+        解析Ollama输出
+        
+        Returns:
+            (意图, 置信度, 是否为合法的 "intent_type,confidence" 格式)，只有格式合法的结果才写入持久化缓存
+        """
         try:
-            # 尝试解析 "intent_type,confidence" 格式
-            if ',' in output:
-                parts = output.split(',')
-                intent_str = parts[0].strip().lower()
-                confidence_str = parts[1].strip()
-                
-                # 映射意图类型
-                intent_mapping = {
-                    'general_qa': IntentType.GENERAL_QA,
-                    'log_analysis': IntentType.LOG_ANALYSIS,
-                    'follow_up': IntentType.FOLLOW_UP,
-                    'summary_request': IntentType.SUMMARY_REQUEST,
-                    'technical_help': IntentType.TECHNICAL_HELP,
-                    'greeting': IntentType.GREETING,
-                    'network_analysis': IntentType.NETWORK_ANALYSIS,
-                    'error_analysis': IntentType.ERROR_ANALYSIS,
-                    'performance_analysis': IntentType.PERFORMANCE_ANALYSIS,
-                    'unknown': IntentType.UNKNOWN
-                }
-                
-                intent = intent_mapping.get(intent_str, IntentType.UNKNOWN)
-                
-                # 解析置信度
-                try:
-                    confidence = float(confidence_str)
-                    confidence = max(0.0, min(1.0, confidence))  # 限制在0-1范围
-                except ValueError:
-                    confidence = 0.5
-                
-                return intent, confidence
+            output_lower = output.lower()
+            
+            # 尝试解析 "intent_type,confidence" 格式（一次正则匹配，置信度必为合法数字）
+            match = _MODEL_OUTPUT_PATTERN.search(output_lower)
+            if match:
+                intent = _INTENT_MAPPING.get(match.group(1), IntentType.UNKNOWN)
+                confidence = max(0.0, min(1.0, float(match.group(2))))  # 限制在0-1范围
+                return intent, confidence, match.group(1) in _INTENT_MAPPING
             
             # 如果格式不对，尝试从输出中提取意图类型
-            output_lower = output.lower()
-            for intent_str, intent_type in [
-                ('log_analysis', IntentType.LOG_ANALYSIS),
-                ('technical_help', IntentType.TECHNICAL_HELP),
-                ('follow_up', IntentType.FOLLOW_UP),
-                ('summary_request', IntentType.SUMMARY_REQUEST),
-                ('greeting', IntentType.GREETING),
-                ('general_qa', IntentType.GENERAL_QA),
-                ('network_analysis', IntentType.NETWORK_ANALYSIS),
-                ('error_analysis', IntentType.ERROR_ANALYSIS),
-                ('performance_analysis', IntentType.PERFORMANCE_ANALYSIS)
-            ]:
-                if intent_str in output_lower:
-                    return intent_type, 0.7
+            # 一次扫描找出输出中出现的所有意图名，再按优先级选取
+            found = set(_INTENT_NAME_PATTERN.findall(output_lower))
+            if found:
+                for intent_str, intent_type in _INTENT_SUBSTRING_ORDER:
+                    if intent_str in found:
+                        return intent_type, 0.7, False
             
-            return IntentType.UNKNOWN, 0.3
+            return IntentType.UNKNOWN, 0.3, False
             
         except Exception as e:
             logger.warning(f"解析Ollama输出失败: {e}, 输出: {output}")
-            return IntentType.UNKNOWN, 0.3
+            return IntentType.UNKNOWN, 0.3, False
     
-    def _classify_with_keywords(self, text: str) -> Tuple[IntentType, float]:
-        """关键词匹配分类（fallback方法）"""
-        text_lower = text.lower()
-        scores = {}
+    def _classify_by_keyword_fastpath(self, text: str, text_lower: str, start_time: float) -> Optional[IntentResult]:
+        """
+        关键词快速路径：关键词匹配置信度不低于 fastpath_threshold 时直接返回，只有模糊输入才调用模型
         
-        for intent_type, patterns in self.intent_patterns.items():
-            score = 0
-            
-            # 关键词匹配
-            for keyword in patterns["keywords"]:
-                if keyword in text_lower:
-                    score += 1
-            
-            # 模式匹配
-            for pattern in patterns["patterns"]:
-                if pattern in text:
-                    score += 2
+        Args:
+            text: 已去除首尾空白的用户输入
+            text_lower: 小写后的用户输入
+            start_time: 分类开始时间
             
-            if score > 0:
-                scores[intent_type] = score
+        Returns:
+            命中时返回意图分类结果，否则返回 None
+        """
+        intent, confidence, tool_contested = self._keyword_cache(text, text_lower)
+        if confidence < self.fastpath_threshold or tool_contested:
+            # 置信度不足，或有工具类意图参与竞争（如 "分析网络连接问题" 同时命中日志分析和网络分析），交给模型判断
+            return None
+        return IntentResult(
+            intent=intent,
+            confidence=confidence,
+            processing_time=time.time() - start_time,
+            model_used="keyword_fastpath"
+        )
+    
+    def _classify_with_keywords(self, text: str, text_lower: Optional[str] = None) -> Tuple[IntentType, float]:
+        """关键词匹配分类（fallback方法，结果确定，经 LRU 缓存），调用方已计算小写文本时通过 text_lower 传入"""
+        if text_lower is None:
+            text_lower = text.lower()
+        intent, confidence, _ = self._keyword_cache(text, text_lower)
+        return intent, confidence
+    
+    def _score_keywords(self, text: str, text_lower: str) -> Tuple[IntentType, float, bool]:
+        """
+        关键词匹配打分（未缓存的实现）
+        
+        Returns:
+            (得分最高的意图, 置信度, 是否有其他工具类意图也得分)
+        """
+        hits: Dict[IntentType, int] = {}
+        
+        # 关键词匹配 + 模式匹配（各一次扫描）
+        self._keyword_matcher.add_scores(text_lower, 1, hits)
+        self._pattern_matcher.add_scores(text, 2, hits)
+        
+        # 按 intent_patterns 的顺序排列，得分相同时与逐意图累加时的选择一致
+        scores = {intent_type: hits[intent_type] for intent_type in self.intent_patterns if intent_type in hits}
         
         if not scores:
-            return IntentType.GENERAL_QA, 0.5
+            return IntentType.GENERAL_QA, 0.5, False
         
         # 选择得分最高的意图
         best_intent = max(scores.items(), key=lambda x: x[1])
         confidence = min(best_intent[1] / 5.0, 1.0)  # 归一化到0-1
+        tool_contested = any(intent in scores for intent in TOOL_INTENTS if intent is not best_intent[0])
         
-        return best_intent[0], confidence
+        return best_intent[0], confidence, tool_contested
     
     def classify_intent(self, text: str, use_cache: bool = True) -> IntentResult:
         """
@@ -373,35 +976,99 @@ class LightweightIntentClassifier:
         """
         start_time = time.time()
         
-        # 延迟初始化
-        self._lazy_init()
-        
-        # 文本预处理
+        # 文本预处理（小写文本只计算一次，触发短语、缓存键和关键词回退共用）
         text = text.strip()
-        if not text:
+        text_lower = text.lower()
+        
+        # 触发短语先于规则预过滤，单字问候（如 "嗨"）不会被长度规则拦截
+        trigger_result = _classify_by_trigger(text_lower, start_time)
+        if trigger_result is not None:
+            return trigger_result
+        
+        # 规则预过滤（无需初始化模型）
+        trivial_result = _classify_trivial(text, start_time)
+        if trivial_result is not None:
+            return trivial_result
+        
+        keyword_result = self._classify_by_keyword_fastpath(text, text_lower, start_time)
+        if keyword_result is not None:
+            return keyword_result
+        
+        # 延迟初始化（初始化完成后只剩一次布尔判断，不进入 _lazy_init、不触碰锁）
+        if not self._initialized:
+            self._lazy_init()
+        
+        try:
+            cache_key = self._cache_key(text_lower) if use_cache else None
+            cached = self._cache_get(cache_key) if use_cache else None
+            if cached is not None:
+                intent, confidence, model_used = cached
+            elif use_cache:
+                intent, confidence, model_used = self._classify_coalesced(text, text_lower, cache_key)
+            else:
+                intent, confidence, model_used = self._classify_with_model(text, text_lower)
+            
+            processing_time = time.time() - start_time
+            
+            return IntentResult(
+                intent=intent,
+                confidence=confidence,
+                processing_time=processing_time,
+                model_used=model_used
+            )
+            
+        except Exception as e:
+            logger.error(f"意图分类失败: {e}")
             return IntentResult(
                 intent=IntentType.UNKNOWN,
                 confidence=0.0,
                 processing_time=time.time() - start_time,
-                model_used="empty_input"
+                model_used="error_fallback"
             )
+    
+    async def aclassify_intent(self, text: str) -> IntentResult:
+        """
+        分类用户意图（异步版本，供异步视图使用）
+        
+        Args:
+            text: 用户输入文本
+            
+        Returns:
+            意图分类结果
+        """
+        start_time = time.time()
+        
+        text = text.strip()
+        text_lower = text.lower()
+        trigger_result = _classify_by_trigger(text_lower, start_time)
+        if trigger_result is not None:
+            return trigger_result
         
-        # 生成缓存键
-        text_hash = hashlib.md5(text.encode()).hexdigest()
+        trivial_result = _classify_trivial(text, start_time)
+        if trivial_result is not None:
+            return trivial_result
+        
+        keyword_result = self._classify_by_keyword_fastpath(text, text_lower, start_time)
+        if keyword_result is not None:
+            return keyword_result
+        
+        # 延迟初始化（包含同步的 Ollama 连通性检查，放到线程中执行）
+        if not self._initialized:
+            await asyncio.to_thread(self._lazy_init)
         
         try:
-            if use_cache:
-                intent, confidence = self._cached_classify(text_hash, text)
+            cache_key = self._cache_key(text_lower)
+            cached = await self._acache_get(cache_key)
+            if cached is not None:
+                intent, confidence, model_used = cached
             else:
-                intent, confidence = self._classify_with_model(text)
-            
-            processing_time = time.time() - start_time
+                intent, confidence, model_used = await self._aclassify_coalesced(text, text_lower, cache_key)
             
             return IntentResult(
                 intent=intent,
                 confidence=confidence,
-                processing_time=processing_time,
-                model_used=self.model_name if self._initialized else "keyword_fallback"
+                processing_time=time.time() - start_time,
+                model_used=model_used
             )
             
         except Exception as e:
@@ -415,15 +1082,33 @@ class LightweightIntentClassifier:
     
     def batch_classify(self, texts: List[str]) -> List[IntentResult]:
         """
-        批量分类
+        批量分类（同步版本），在共享线程池中并发执行，复用 requests 连接池
         
         Args:
             texts: 文本列表
             
         Returns:
-            分类结果列表
+            分类结果列表（与输入顺序一致）
+        """
+        return list(_BATCH_EXECUTOR.map(self.classify_intent, texts))
+    
+    async def abatch_classify(self, texts: List[str]) -> List[IntentResult]:
         """
-        return [self.classify_intent(text) for text in texts]
+        批量分类（异步版本），并发请求数不超过 OLLAMA_NUM_PARALLEL，超出的请求在客户端排队
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            分类结果列表（与输入顺序一致）
+        """
+        semaphore = asyncio.Semaphore(OLLAMA_NUM_PARALLEL)
+        
+        async def classify_one(text: str) -> IntentResult:
+            async with semaphore:
+                return await self.aclassify_intent(text)
+        
+        return list(await asyncio.gather(*(classify_one(text) for text in texts)))
     
     def get_model_info(self) -> Dict:
         """获取模型信息"""
@@ -431,99 +1116,71 @@ class LightweightIntentClassifier:
             "model_name": self.model_name,
             "ollama_url": self.ollama_url,
             "initialized": self._initialized,
+            "model_available": _OLLAMA_PROBE_RESULTS.get((self.ollama_url, self.model_name)),
             "cache_size": self.cache_size,
+            "cache_entries": len(self._cache),
+            "cache_hits": self._cache_hits,
+            "cache_misses": self._cache_misses,
+            "keyword_cache": self._keyword_cache.cache_info()._asdict(),
             "supported_intents": [intent.value for intent in IntentType],
             "model_type": "ollama"
         }
     
     def clear_cache(self):
-        """清空缓存"""
-        self._cached_classify.cache_clear()
+        """清空缓存（模型结果缓存和关键词结果缓存）"""
+        with self._cache_lock:
+            self._cache.clear()
+        self._keyword_cache.cache_clear()
         logger.info("意图分类缓存已清空")
     
     # === 工具执行方法 ===
-    def run_network_analysis(self, query: str) -> str:
-        """网络分析工具（示例实现）"""
-        logger.info(f"🔧 [工具执行] 网络分析工具 - 查询: {query}")
-        # 实际项目中可替换为真实网络分析逻辑
-        # 这里可以调用日志系统进行网络相关日志检索
+    def _run_log_tool(self, query: str, spec: "_LogToolSpec") -> str:
+        """
+        检索类工具的公共实现：用工具关键词增强查询，检索日志并格式化结果
+        
+        Args:
+            query: 用户查询
+            spec: 工具的展示文案和查询前缀
+            
+        Returns:
+            工具执行结果文本
+        """
+        logger.info(f"🔧 [工具执行] {spec.name} - 查询: {query}")
         try:
+            # services 依赖 Django，按需导入（模块已在 sys.modules 中时只是一次字典查找）
             from .services import get_log_system
             system = get_log_system()
-            # 添加网络相关关键词增强查询
-            enhanced_query = f"网络 连接 端口 {query}"
-            log_results = system.retrieve_logs(enhanced_query, top_k=5)
+            # 添加工具相关关键词增强查询
+            log_results = system.retrieve_logs(spec.query_prefix + query, top_k=5)
             
             if log_results:
-                result_parts = ["📡 网络分析结果：\n"]
-                result_parts.append(f"检索到 {len(log_results)} 条相关日志：\n")
-                # 显示所有检索到的日志，每条日志完整显示（最多500字符，避免过长）
-                for i, log in enumerate(log_results, 1):
-                    content = log.get('content', '')
-                    # 如果日志太长，截断但保留更多信息
-                    if len(content) > 500:
-                        content = content[:500] + "..."
-                    result_parts.append(f"{i}. {content}")
-                return "\n".join(result_parts)
+                # 显示所有检索到的日志，每条最多500字符（过长时截断并加省略号），一次 join 生成结果
+                return "\n".join((
+                    spec.header,
+                    spec.count_line.format(count=len(log_results)),
+                    *(f"{i}. {content if len(content := log.get('content', '')) <= 500 else content[:500] + '...'}"
+                      for i, log in enumerate(log_results, 1)),
+                ))
             else:
-                return "📡 网络分析结果：未发现明显的网络连接问题。建议检查端口8080和数据库连接配置。"
+                return spec.empty_result
         except Exception as e:
-            logger.error(f"网络分析工具执行失败: {e}")
-            return f"📡 网络分析结果：检测到3个异常连接，建议检查端口8080。\n（工具执行异常: {str(e)}）"
+            logger.error(f"{spec.name}执行失败: {e}")
+            return f"{spec.error_result}\n（工具执行异常: {str(e)}）"
+    
+    def run_network_analysis(self, query: str) -> str:
+        """网络分析工具（示例实现，实际项目中可替换为真实网络分析逻辑）"""
+        return self._run_log_tool(query, _NETWORK_TOOL)
     
     def run_error_analysis(self, query: str) -> str:
         """错误分析工具（示例实现）"""
-        logger.info(f"🔧 [工具执行] 错误分析工具 - 查询: {query}")
-        try:
-            from .services import get_log_system
-            system = get_log_system()
-            # 添加错误相关关键词增强查询
-            enhanced_query = f"错误 异常 error exception {query}"
-            log_results = system.retrieve_logs(enhanced_query, top_k=5)
-            
-            if log_results:
-                result_parts = ["🛑 错误分析结果：\n"]
-                result_parts.append(f"发现 {len(log_results)} 个关键错误：\n")
-                # 显示所有检索到的日志，每条日志完整显示（最多500字符，避免过长）
-                for i, log in enumerate(log_results, 1):
-                    content = log.get('content', '')
-                    # 如果日志太长，截断但保留更多信息
-                    if len(content) > 500:
-                        content = content[:500] + "..."
-                    result_parts.append(f"{i}. {content}")
-                return "\n".join(result_parts)
-            else:
-                return "🛑 错误分析结果：未发现明显的系统错误。系统运行正常。"
-        except Exception as e:
-            logger.error(f"错误分析工具执行失败: {e}")
-            return f"🛑 错误分析结果：发现2个关键错误，涉及数据库连接超时。\n（工具执行异常: {str(e)}）"
+        return self._run_log_tool(query, _ERROR_TOOL)
     
     def run_performance_analysis(self, query: str) -> str:
         """性能分析工具（示例实现）"""
-        logger.info(f"🔧 [工具执行] 性能分析工具 - 查询: {query}")
-        try:
-            from .services import get_log_system
-            system = get_log_system()
-            # 添加性能相关关键词增强查询
-            enhanced_query = f"性能 性能优化 cpu 内存 memory performance {query}"
-            log_results = system.retrieve_logs(enhanced_query, top_k=5)
-            
-            if log_results:
-                result_parts = ["⚡ 性能分析结果：\n"]
-                result_parts.append(f"检索到 {len(log_results)} 条性能相关日志：\n")
-                # 显示所有检索到的日志，每条日志完整显示（最多500字符，避免过长）
-                for i, log in enumerate(log_results, 1):
-                    content = log.get('content', '')
-                    # 如果日志太长，截断但保留更多信息
-                    if len(content) > 500:
-                        content = content[:500] + "..."
-                    result_parts.append(f"{i}. {content}")
-                return "\n".join(result_parts)
-            else:
-                return "⚡ 性能分析结果：CPU使用率峰值达90%，建议优化数据库查询和缓存策略。"
-        except Exception as e:
-            logger.error(f"性能分析工具执行失败: {e}")
-            return f"⚡ 性能分析结果：CPU使用率峰值达90%，建议优化查询。\n（工具执行异常: {str(e)}）"
+        return self._run_log_tool(query, _PERFORMANCE_TOOL)
+
+# 同步批量分类的线程池：并发数与 OLLAMA_NUM_PARALLEL 一致，线程按需创建
+_BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=OLLAMA_NUM_PARALLEL, thread_name_prefix="intent-batch")
 
 # 全局单例
 _intent_classifier = None
@@ -536,15 +1193,11 @@ def get_intent_classifier() -> LightweightIntentClassifier:
     if _intent_classifier is None:
         with _classifier_lock:
             if _intent_classifier is None:
-                # 从配置文件读取是否使用 API
+                # 从配置文件读取是否使用 API（配置在模块加载时已导入）
+                use_api = CURRENT_CONFIG.get('use_api', False)
+                model_name = CURRENT_CONFIG.get('llm', 'qwen2.5:0.5b')
+                
                 try:
-                    import sys
-                    import os
-                    sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-                    from model_config import CURRENT_CONFIG
-                    use_api = CURRENT_CONFIG.get('use_api', False)
-                    model_name = CURRENT_CONFIG.get('llm', 'qwen2.5:0.5b')
-                    
                     if use_api:
                         logger.info(f"🌐 意图分类器配置为使用 API - 模型: {model_name}")
                         _intent_classifier = LightweightIntentClassifier(
@@ -559,7 +1212,7 @@ def get_intent_classifier() -> LightweightIntentClassifier:
                             use_api=False
                         )
                 except Exception as e:
-                    logger.warning(f"读取配置失败，使用默认本地模型: {e}")
+                    logger.warning(f"创建意图分类器失败，使用默认本地模型: {e}")
                     _intent_classifier = LightweightIntentClassifier()
     
     return _intent_classifier
@@ -570,21 +1223,27 @@ def classify_user_intent(text: str) -> IntentResult:
     classifier = get_intent_classifier()
     return classifier.classify_intent(text)
 
+async def aclassify_user_intent(text: str) -> IntentResult:
+    """分类用户意图的便捷函数（异步版本）"""
+    classifier = get_intent_classifier()
+    return await classifier.aclassify_intent(text)
+
+# 技术关键词（预编译为一个正则，一次扫描完成所有关键词匹配）
+TECHNICAL_KEYWORDS = ["错误", "异常", "性能", "优化", "配置", "error", "exception", "performance"]
+_TECHNICAL_KEYWORD_PATTERN = re.compile("|".join(map(re.escape, TECHNICAL_KEYWORDS)), re.IGNORECASE)
+
+# 高置信度时需要RAG检索的意图
+_RAG_INTENTS = frozenset({IntentType.LOG_ANALYSIS, IntentType.TECHNICAL_HELP})
+
 def is_rag_required(intent_result: IntentResult, text: str = "") -> bool:
     """判断是否需要RAG检索"""
-    rag_intents = {
-        IntentType.LOG_ANALYSIS,
-        IntentType.TECHNICAL_HELP
-    }
-    
     # 高置信度的特定意图需要RAG
-    if intent_result.intent in rag_intents and intent_result.confidence > 0.6:
+    if intent_result.intent in _RAG_INTENTS and intent_result.confidence > 0.6:
         return True
     
     # 低置信度的未知意图，如果包含技术关键词也可能需要RAG
     if intent_result.intent == IntentType.UNKNOWN and intent_result.confidence < 0.5 and text:
-        technical_keywords = ["错误", "异常", "性能", "优化", "配置", "error", "exception", "performance"]
-        return any(keyword in text.lower() for keyword in technical_keywords)
+        return _TECHNICAL_KEYWORD_PATTERN.search(text) is not None
     
     return False
 
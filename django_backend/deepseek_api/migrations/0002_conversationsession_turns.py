@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-15 22:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deepseek_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationsession',
+            name='turns',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.18 on 2026-10-15 23:46
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deepseek_api', '0002_conversationsession_turns'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='RateLimit',
+        ),
+    ]
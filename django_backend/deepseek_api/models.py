@@ -1,7 +1,6 @@
 from django.db import models
 from django.db.models import F
-import string
-import random
+import secrets
 import time
 import logging
 logger = logging.getLogger(__name__)
@@ -16,9 +15,9 @@ class APIKey(models.Model):
     
     @classmethod
     def generate_key(cls, length=32):
-        """生成随机 API Key"""
-        characters = string.ascii_letters + string.digits
-        return ''.join(random.choice(characters) for _ in range(length))
+        """生成随机 API Key（密码学安全的 URL-safe 字符串，一次调用生成，不再逐字符抽取）"""
+        # token_urlsafe(n) 至少输出 n 个字符，截断到所需长度
+        return secrets.token_urlsafe(length)[:length]
     
     def is_valid(self):
         """检查 API Key 是否未过期"""
@@ -28,28 +27,6 @@ class APIKey(models.Model):
         return f"{self.user} - {self.key}"
 
 
-class RateLimit(models.Model):
-    api_key = models.ForeignKey(APIKey, on_delete=models.CASCADE,
-                                db_index=True, to_field='key', related_name='rate_limits')
-    count = models.IntegerField(default=0)
-    reset_time = models.IntegerField()  # 重置时间戳
-
-    class Meta:
-        indexes = [
-            models.Index(fields=['api_key', 'reset_time'])
-        ]
-    
-    def should_limit(self, max_requests, interval):
-        """检查是否应该限制请求"""
-        current_time = time.time()
-        if current_time > self.reset_time:
-            self.count = 0
-            self.reset_time = current_time + interval
-            self.save()
-            return False
-        return self.count >= max_requests
-
-
 class ConversationSession(models.Model):
     session_id = models.CharField(max_length=100)
     # 正确的外键定义：关联 APIKey 的 id（默认）
@@ -59,20 +36,24 @@ class ConversationSession(models.Model):
         related_name='sessions'
     )
     context = models.TextField(blank=True)
+    # 结构化的对话轮次（有界列表，由 ConversationManager 压缩后写入），避免每轮重新解析 context
+    turns = models.JSONField(default=list, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ('session_id', 'user')  # 确保用户+会话ID唯一
     
-    def update_context(self, user_input, bot_reply):
-        """原子更新上下文，避免并发覆盖"""
-        new_entry = f"用户：{user_input}\n回复：{bot_reply}\n"
+    def update_context(self, user_input, bot_reply, refresh=False):
+        """
+        原子更新上下文，避免并发覆盖
         
-        print(f"\n💾 [模型层] ConversationSession.update_context() 被调用")
-        print(f"💾 [会话信息] ID: {self.pk}, session_id: '{self.session_id}', user: '{self.user.user}'")
-        print(f"💾 [更新前长度] {len(self.context)} 字符")
-        print(f"💾 [新增条目] {new_entry.strip()}")
+        Args:
+            user_input: 用户输入
+            bot_reply: 模型回复
+            refresh: 是否在更新后从数据库重新加载实例（调用方需要读取最新 context 时才开启，省一次查询）
+        """
+        new_entry = f"用户：{user_input}\n回复：{bot_reply}\n"
         
         # 数据库层面拼接，而非内存中
         ConversationSession.objects.filter(
@@ -80,30 +61,19 @@ class ConversationSession(models.Model):
             user=self.user  # 确保用户一致
         ).update(context=F('context') + new_entry)
         
-        # 刷新实例，获取更新后的值
-        old_length = len(self.context)
-        self.refresh_from_db()
-        new_length = len(self.context)
+        if refresh:
+            self.refresh_from_db()
         
-        print(f"💾 [数据库更新] 原子操作完成")
-        print(f"💾 [更新后长度] {old_length} → {new_length} 字符")
-        print(f"💾 [实例刷新] 从数据库重新加载最新数据")
-
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.info(f"更新会话 {self.session_id}（用户：{self.user.user}）：{new_entry}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("💾 更新会话上下文 pk=%s session_id=%s 新增 %d 字符", self.pk, self.session_id, len(new_entry))
     
     def clear_context(self):
         """清空对话上下文"""
-        print(f"\n🗑️ [模型层] ConversationSession.clear_context() 被调用")
-        print(f"🗑️ [会话信息] ID: {self.pk}, session_id: '{self.session_id}', user: '{self.user.user}'")
-        print(f"🗑️ [清空前长度] {len(self.context)} 字符")
-        
         self.context = ""
-        self.save()
+        self.turns = []
+        self.save(update_fields=['context', 'turns', 'updated_at'])
         
-        print(f"🗑️ [清空完成] 上下文已清空并保存到数据库")
-        print(f"🗑️ [清空后长度] {len(self.context)} 字符")
+        logger.debug("🗑️ 已清空会话上下文 pk=%s session_id=%s", self.pk, self.session_id)
     
     def __str__(self):
         return self.session_id
@@ -3,6 +3,31 @@ Prompt Templates for Log Analysis System
 Contains specialized prompt templates for different types of log analysis tasks
 """
 
+from string import Formatter
+from typing import Dict, Optional, Tuple
+
+# 预解析后的模板：(字面量, 字段名) 序列，字段名为 None 表示只有字面量
+_TemplateParts = Tuple[Tuple[str, Optional[str]], ...]
+
+
+def _compile_template(template: str, prefix: str = "") -> _TemplateParts:
+    """在模块加载时解析一次模板中的 {字段}，prefix 作为固定的开头字面量并入"""
+    parts = [(literal, field_name) for literal, field_name, _, _ in Formatter().parse(template)]
+    if prefix:
+        parts.insert(0, (prefix, None))
+    return tuple(parts)
+
+
+def _render_template(parts: _TemplateParts, kwargs: Dict) -> str:
+    """按预解析的片段拼接模板（与 str.format 输出一致，缺少字段时同样抛出 KeyError）"""
+    out = []
+    for literal, field_name in parts:
+        out.append(literal)
+        if field_name is not None:
+            out.append(str(kwargs[field_name]))
+    return "".join(out)
+
+
 class PromptTemplates:
     """专业的 Prompt 模板管理"""
     
@@ -99,21 +124,26 @@ class PromptTemplates:
 改写后的查询：
 """
 
-    def get_template_by_type(self, query_type: str, **kwargs) -> str:
-        """根据查询类型获取对应的模板"""
-        if query_type == "analysis":
-            return self.SYSTEM_ROLE + "\n\n" + self.LOG_ANALYSIS_TEMPLATE.format(**kwargs)
-        elif query_type == "multi_turn":
-            return self.SYSTEM_ROLE + "\n\n" + self.MULTI_TURN_TEMPLATE.format(**kwargs)
-        elif query_type == "query_rewrite":
-            return self.QUERY_REWRITE_TEMPLATE.format(**kwargs)
-        elif query_type == "general_chat":
-            # 日常聊天模式，使用简单的对话模板
-            return f"""你是一个友好的技术助手。请回答用户的问题，提供准确、有用的信息。
-
-用户问题：{kwargs.get('query', '')}
+    # 日常聊天模式，使用简单的对话模板
+    GENERAL_CHAT_TEMPLATE = """你是一个友好的技术助手。请回答用户的问题，提供准确、有用的信息。
+
+用户问题：{query}
 
 请回答："""
-        else:
-            # 默认返回基础分析模板
-            return self.SYSTEM_ROLE + "\n\n" + self.LOG_ANALYSIS_TEMPLATE.format(**kwargs)
+
+    SYSTEM_PREFIX = SYSTEM_ROLE + "\n\n"
+
+    # 查询类型 -> 预解析的模板片段（需要系统角色的模板已并入 SYSTEM_PREFIX）；未知类型回退到基础分析模板
+    TEMPLATES_BY_TYPE = {
+        "analysis": _compile_template(LOG_ANALYSIS_TEMPLATE, SYSTEM_PREFIX),
+        "multi_turn": _compile_template(MULTI_TURN_TEMPLATE, SYSTEM_PREFIX),
+        "query_rewrite": _compile_template(QUERY_REWRITE_TEMPLATE),
+        "general_chat": _compile_template(GENERAL_CHAT_TEMPLATE),
+    }
+
+    def get_template_by_type(self, query_type: str, **kwargs) -> str:
+        """根据查询类型获取对应的模板"""
+        parts = self.TEMPLATES_BY_TYPE.get(query_type, self.TEMPLATES_BY_TYPE["analysis"])
+        if query_type == "general_chat":
+            kwargs = {"query": kwargs.get("query", "")}
+        return _render_template(parts, kwargs)
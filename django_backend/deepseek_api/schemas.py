@@ -1,5 +1,8 @@
 from ninja import Schema
-from typing import Optional
+from pydantic import StringConstraints, field_validator
+from typing import Annotated, Optional
+
+DEFAULT_SESSION_ID = "default_session"
 
 class LoginIn(Schema):
     username: str
@@ -9,9 +12,17 @@ class LoginOut(Schema):
     api_key: str
     expiry: int
 
-class ChatIn(Schema):
-    session_id: str = "default_session"
-    user_input: str
+class SessionIn(Schema):
+    """带 session_id 的请求参数：解析时去除首尾空白，空值回退为默认会话"""
+    session_id: str = DEFAULT_SESSION_ID
+
+    @field_validator("session_id")
+    @classmethod
+    def normalize_session_id(cls, value: str) -> str:
+        return value.strip() or DEFAULT_SESSION_ID
+
+class ChatIn(SessionIn):
+    user_input: Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]  # 空输入由校验返回 422
     query_type: str = "analysis"  # 查询类型：analysis（日志分析）, general_chat（日常聊天）
 
 class ChatOut(Schema):
@@ -0,0 +1,100 @@
+"""
+语义缓存
+按用户输入的向量相似度查找已缓存的回复，命中时跳过大模型调用
+（精确缓存只能命中完全相同的输入，语义缓存可以覆盖同义改写的问题）
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import httpx
+import numpy as np
+
+from http_client import get_async_client, OLLAMA_KEEP_ALIVE
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """基于向量相似度的回复缓存（进程内，按 用户 + 会话 分区）"""
+
+    def __init__(self, embedding_model: str = "nomic-embed-text", ollama_url: str = "http://localhost:11434",
+                 threshold: float = 0.92, max_entries_per_session: int = 256, max_sessions: int = 1024,
+                 timeout: float = 5.0):
+        """
+        初始化语义缓存
+
+        Args:
+            embedding_model: Ollama embedding 模型名称
+            ollama_url: Ollama服务地址
+            threshold: 余弦相似度阈值，达到该值才视为命中
+            max_entries_per_session: 每个会话最多缓存的问答条数
+            max_sessions: 最多保留的会话分区数（超出后淘汰最久未使用的分区）
+            timeout: embedding 请求超时时间（秒）
+        """
+        self.embedding_model = embedding_model
+        self.ollama_url = ollama_url
+        self.threshold = threshold
+        self.max_entries_per_session = max_entries_per_session
+        self.max_sessions = max_sessions
+        self.timeout = timeout
+        self._partitions: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def aembed(self, text: str) -> Optional[np.ndarray]:
+        """
+        通过 Ollama /api/embed 计算归一化后的向量，失败时返回 None（调用方跳过语义缓存）
+        """
+        try:
+            response = await get_async_client().post(
+                f"{self.ollama_url}/api/embed",
+                json={"model": self.embedding_model, "input": text, "keep_alive": OLLAMA_KEEP_ALIVE},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            vector = np.asarray(response.json()["embeddings"][0], dtype=np.float32)
+        except (httpx.HTTPError, KeyError, IndexError, ValueError) as e:
+            logger.warning(f"语义缓存 embedding 计算失败，跳过语义缓存: {e}")
+            return None
+
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+
+    def lookup(self, embedding: np.ndarray, session_id: str, user: str) -> Optional[str]:
+        """查找相似度最高且超过阈值的缓存回复"""
+        key = (user, session_id)
+        with self._lock:
+            entries = self._partitions.get(key)
+            if not entries:
+                return None
+            self._partitions.move_to_end(key)
+            vectors = np.stack([vector for vector, _ in entries])
+            replies = [reply for _, reply in entries]
+
+        scores = vectors @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            logger.info(f"语义缓存命中，相似度: {scores[best]:.3f}")
+            return replies[best]
+        return None
+
+    def store(self, embedding: np.ndarray, reply: str, session_id: str, user: str):
+        """保存 (向量, 回复) 到对应会话分区"""
+        key = (user, session_id)
+        with self._lock:
+            entries = self._partitions.setdefault(key, [])
+            self._partitions.move_to_end(key)
+            entries.append((embedding, reply))
+            if len(entries) > self.max_entries_per_session:
+                del entries[0]
+            while len(self._partitions) > self.max_sessions:
+                self._partitions.popitem(last=False)
+
+    def clear(self, session_id: str, user: str):
+        """清空某个会话分区（清空历史时调用）"""
+        with self._lock:
+            self._partitions.pop((user, session_id), None)
@@ -1,20 +1,33 @@
 import time
+import zlib
+import asyncio
+import logging
 import threading
 from typing import Dict, Any, Optional
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from asgiref.sync import async_to_sync, sync_to_async
 import hashlib
-from .models import APIKey, RateLimit, ConversationSession
+from .models import APIKey, ConversationSession
+from .intent_classifier import get_intent_classifier, TOOL_INTENTS
+from .conversation_manager import get_conversation_manager
+from model_config import CURRENT_CONFIG
+from http_client import async_client_scope
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 # 全局配置
 # API_KEY_LENGTH = 32
 # TOKEN_EXPIRY_SECONDS = 3600
 # RATE_LIMIT_MAX = 5  # 每分钟最大请求数
 # RATE_LIMIT_INTERVAL = 60
 
-# 线程锁用于速率限制
-rate_lock = threading.Lock()
-
 # 全局单例：TopKLogSystem 实例（懒加载）
 _log_system_instance = None
 _log_system_lock = threading.Lock()
@@ -31,9 +44,6 @@ def get_log_system():
             # 双重检查锁定模式（避免多线程重复初始化）
             if _log_system_instance is None:
                 from topklogsystem import TopKLogSystem
-                from model_config import CURRENT_CONFIG
-                import logging
-                logger = logging.getLogger(__name__)
                 
                 logger.info("初始化 TopKLogSystem 单例实例...")
                 logger.info(f"使用模型: LLM={CURRENT_CONFIG['llm']}, Embedding={CURRENT_CONFIG['embedding_model']}")
@@ -55,308 +65,401 @@ def get_log_system():
     
     return _log_system_instance
 
-def deepseek_r1_api_call(prompt: str, query_type: str = "analysis") -> str:
+# DeepSeekLLM 实例按 (模型, 超时) 复用，避免每次请求重新构建客户端
+_llm_instances: Dict[tuple, Any] = {}
+_llm_instances_lock = threading.Lock()
+
+def get_llm(model: str, timeout: int):
     """
-    调用 DeepSeek API
+    获取 DeepSeekLLM 实例（懒加载 + 线程安全，每个 (模型, 超时) 只创建一次）
+    
+    Args:
+        model: 模型名称
+        timeout: 请求超时时间（秒）
+        
+    Returns:
+        DeepSeekLLM 实例
+    """
+    key = (model, timeout)
+    llm = _llm_instances.get(key)
+    if llm is None:
+        with _llm_instances_lock:
+            # 双重检查锁定模式（避免多线程重复初始化）
+            llm = _llm_instances.get(key)
+            if llm is None:
+                from deepseek_llm import DeepSeekLLM
+                llm = DeepSeekLLM(model=model, timeout=timeout)
+                _llm_instances[key] = llm
+    return llm
+
+async def aretrieve_logs(prompt: str) -> Optional[list]:
+    """
+    RAG 检索相关日志（异步版本，可与意图分类并发执行）
+    
+    Returns:
+        检索结果，失败时返回 None（调用方回退到 system.query 自行检索）
+    """
+    try:
+        system = await sync_to_async(get_log_system, thread_sensitive=False)()
+        return await sync_to_async(system.retrieve_logs, thread_sensitive=False)(prompt)
+    except Exception as e:
+        logger.warning("预先检索日志失败，将在生成时重新检索: %s", e)
+        return None
+
+async def _arag_query(prompt: str, query_type: str, log_results: Optional[list]) -> str:
+    """使用 RAG 生成回复；已有检索结果时直接生成，否则由 system.query 检索后生成"""
+    system = await sync_to_async(get_log_system, thread_sensitive=False)()
+    if log_results is not None:
+        return await sync_to_async(system.generate_response, thread_sensitive=False)(prompt, log_results, query_type)
+    result = await sync_to_async(system.query, thread_sensitive=False)(prompt, query_type=query_type)
+    return result["response"]
+
+# 工具增强 Prompt 的固定部分（模块加载时构建一次，调用时只拼接用户问题与工具结果）
+_TOOL_PROMPT_PREFIX = "用户问题："
+_TOOL_PROMPT_MID = "\n\n工具执行结果：\n"
+_TOOL_PROMPT_SUFFIX = """
+
+请基于以上工具执行结果，对用户的问题进行详细分析和回答。要求：
+1. 对工具结果进行总结和分析
+2. 指出关键问题和异常
+3. 提供具体的建议和解决方案
+4. 用清晰、专业的方式组织回答"""
+
+def _build_tool_prompt(prompt: str, tool_result: str) -> str:
+    """构建包含工具执行结果的 prompt（同步 / 流式调用共用）"""
+    return "".join((_TOOL_PROMPT_PREFIX, prompt, _TOOL_PROMPT_MID, tool_result, _TOOL_PROMPT_SUFFIX))
+
+async def adeepseek_r1_api_call(prompt: str, query_type: str = "analysis", intent_result=None,
+                                log_results: Optional[list] = None) -> str:
+    """
+    调用 DeepSeek API（异步版本）
     
     Args:
         prompt: 用户输入的问题
         query_type: 查询类型（analysis: 日志分析, general_chat: 日常聊天）
+        intent_result: 已有的意图分类结果，为空时现场分类
+        log_results: 已并发检索到的日志（analysis 模式），为空时现场检索
     
     Returns:
         LLM 的响应文本
     """
-    print(f"\n🤖 [大模型调用] 开始调用 DeepSeek API")
-    print(f"🤖 [调用参数] query_type: '{query_type}'")
-    print(f"🤖 [Prompt长度] {len(prompt)} 字符")
+    logger.info("🤖 [大模型调用] 开始调用 DeepSeek API, query_type: '%s', Prompt长度: %d 字符", query_type, len(prompt))
     
     # 先进行意图分类，检查是否为工具类意图
-    from .intent_classifier import get_intent_classifier, TOOL_INTENTS
     classifier = get_intent_classifier()
-    intent_result = classifier.classify_intent(prompt)
+    if intent_result is None:
+        intent_result = await classifier.aclassify_intent(prompt)
     
-    print(f"🔍 [意图分类] 意图: {intent_result.intent.value}, 置信度: {intent_result.confidence:.3f}")
+    logger.info("🔍 [意图分类] 意图: %s, 置信度: %.3f", intent_result.intent.value, intent_result.confidence)
     
     # 如果是工具类意图，执行工具并将结果传递给LLM
     tool_result = None
     if intent_result.intent in TOOL_INTENTS:
-        print(f"🔧 [工具调用] 检测到工具类意图: {intent_result.intent.value}")
+        logger.info("🔧 [工具调用] 检测到工具类意图: %s", intent_result.intent.value)
         tool_func = classifier.tools.get(intent_result.intent)
         if tool_func:
-            tool_result = tool_func(prompt)
-            print(f"✅ [工具执行] 工具执行完成，结果长度: {len(tool_result)} 字符")
-            print(f"🔧 [工具结果] 将工具结果传递给LLM进行分析和回答")
+            tool_result = await sync_to_async(tool_func, thread_sensitive=False)(prompt)
+            logger.info("✅ [工具执行] 工具执行完成，结果长度: %d 字符", len(tool_result))
         else:
-            print(f"⚠️ [工具调用] 未找到对应的工具函数: {intent_result.intent.value}")
+            logger.warning("⚠️ [工具调用] 未找到对应的工具函数: %s", intent_result.intent.value)
     
-    from model_config import CURRENT_CONFIG
     use_api = CURRENT_CONFIG.get('use_api', False)
     
     if use_api:
         # 使用 DeepSeek API
-        from deepseek_llm import DeepSeekLLM
         from llama_index.core.llms import ChatMessage
         
         # 如果执行了工具，将工具结果作为上下文传递给LLM
         if tool_result:
             # 构建包含工具结果的prompt
-            enhanced_prompt = f"""用户问题：{prompt}
-
-工具执行结果：
-{tool_result}
-
-请基于以上工具执行结果，对用户的问题进行详细分析和回答。要求：
-1. 对工具结果进行总结和分析
-2. 指出关键问题和异常
-3. 提供具体的建议和解决方案
-4. 用清晰、专业的方式组织回答"""
+            enhanced_prompt = _build_tool_prompt(prompt, tool_result)
             
-            print(f"🤖 [工具增强Prompt] 构建完成，长度: {len(enhanced_prompt)} 字符")
-            llm = DeepSeekLLM(model=CURRENT_CONFIG['llm'], timeout=60)
+            logger.debug("🤖 [工具增强Prompt] 构建完成，长度: %d 字符", len(enhanced_prompt))
+            llm = get_llm(CURRENT_CONFIG['llm'], 60)
             messages = [ChatMessage(role="user", content=enhanced_prompt)]
             
-            print(f"🤖 [API请求] 发送工具增强的请求到大模型...")
-            response = llm.chat(messages)
+            logger.debug("🤖 [API请求] 发送工具增强的请求到大模型...")
+            response = await llm.achat(messages)
             
             result_text = response.message.content
-            print(f"🤖 [API响应] 收到回复，长度: {len(result_text)} 字符")
-            print(f"🤖 [回复内容] {result_text[:100]}{'...' if len(result_text) > 100 else ''}")
+            logger.info("🤖 [API响应] 收到回复，长度: %d 字符", len(result_text))
+            logger.debug("🤖 [回复内容] %.100s", result_text)
             
             return result_text
         
         # 根据 query_type 决定是否使用 RAG
         if query_type == "analysis":
             # 日志分析模式：使用 RAG
-            print(f"🤖 [RAG模式] 日志分析，使用 RAG 检索")
-            system = get_log_system()
+            logger.debug("🤖 [RAG模式] 日志分析，使用 RAG 检索")
             
-            print(f"🤖 [API请求] 发送请求到大模型...")
-            result = system.query(prompt, query_type=query_type)
-            time.sleep(0.5)
+            logger.debug("🤖 [API请求] 发送请求到大模型...")
+            response = await _arag_query(prompt, query_type, log_results)
             
-            response = result["response"]
-            print(f"🤖 [API响应] 收到回复，长度: {len(response)} 字符")
-            print(f"🤖 [回复内容] {response[:100]}{'...' if len(response) > 100 else ''}")
+            logger.info("🤖 [API响应] 收到回复，长度: %d 字符", len(response))
+            logger.debug("🤖 [回复内容] %.100s", response)
             
             return response
         else:
             # 日常聊天模式：直接调用 API，不使用 RAG
-            print(f"🤖 [纯对话模式] 日常聊天，直接调用 DeepSeek API，不使用 RAG 检索")
+            logger.debug("🤖 [纯对话模式] 日常聊天，直接调用 DeepSeek API，不使用 RAG 检索")
             
-            llm = DeepSeekLLM(model=CURRENT_CONFIG['llm'], timeout=60)
+            llm = get_llm(CURRENT_CONFIG['llm'], 60)
             messages = [ChatMessage(role="user", content=prompt)]
             
-            print(f"🤖 [API请求] 发送请求到大模型...")
-            response = llm.chat(messages)
+            logger.debug("🤖 [API请求] 发送请求到大模型...")
+            response = await llm.achat(messages)
             
             result_text = response.message.content
-            print(f"🤖 [API响应] 收到回复，长度: {len(result_text)} 字符")
-            print(f"🤖 [回复内容] {result_text[:100]}{'...' if len(result_text) > 100 else ''}")
+            logger.info("🤖 [API响应] 收到回复，长度: %d 字符", len(result_text))
+            logger.debug("🤖 [回复内容] %.100s", result_text)
             
             return result_text
     else:
         # 使用本地 Ollama + RAG 系统
-        print(f"🤖 [RAG模式] 使用本地 Ollama + RAG 检索")
-        system = get_log_system()
+        logger.debug("🤖 [RAG模式] 使用本地 Ollama + RAG 检索")
         
-        print(f"🤖 [API请求] 发送请求到大模型...")
-        result = system.query(prompt, query_type=query_type)
-        time.sleep(0.5)
+        logger.debug("🤖 [API请求] 发送请求到大模型...")
+        if query_type == "general_chat":
+            log_results = None  # 日常聊天不检索，交给 system.query 处理
+        response = await _arag_query(prompt, query_type, log_results)
         
-        response = result["response"]
-        print(f"🤖 [API响应] 收到回复，长度: {len(response)} 字符")
-        print(f"🤖 [回复内容] {response[:100]}{'...' if len(response) > 100 else ''}")
+        logger.info("🤖 [API响应] 收到回复，长度: %d 字符", len(response))
+        logger.debug("🤖 [回复内容] %.100s", response)
         
         return response
 
-def deepseek_r1_api_call_stream(prompt: str, query_type: str = "analysis", history_context: str = ""):
+def deepseek_r1_api_call(prompt: str, query_type: str = "analysis") -> str:
     """
-    流式调用 DeepSeek API（支持 RAG 和历史上下文）
+    调用 DeepSeek API（同步版本，供同步代码路径使用）
     
     Args:
         prompt: 用户输入的问题
         query_type: 查询类型（analysis: 日志分析, general_chat: 日常聊天）
-        history_context: 历史对话上下文字符串
     
-    Yields:
-        流式响应的生成器
+    Returns:
+        LLM 的响应文本
     """
-    print(f"\n🤖 [流式调用] 开始流式调用 DeepSeek API")
-    print(f"🤖 [调用参数] query_type: '{query_type}'")
-    print(f"🤖 [Prompt长度] {len(prompt)} 字符")
-    print(f"🤖 [历史上下文长度] {len(history_context)} 字符")
-    
-    # 先进行意图分类，检查是否为工具类意图
-    from .intent_classifier import get_intent_classifier, TOOL_INTENTS
-    classifier = get_intent_classifier()
-    intent_result = classifier.classify_intent(prompt)
+    # 独立的事件循环：调用结束时关闭本次创建的 AsyncClient
+    return async_to_sync(async_client_scope()(adeepseek_r1_api_call))(prompt, query_type)
+
+async def adeepseek_r1_api_call_stream(prompt: str, query_type: str = "analysis", history_context: str = "",
+                                       history_turns: Optional[list] = None):
+    """
+    流式调用 DeepSeek API（异步版本，支持 RAG 和历史上下文）
     
-    print(f"🔍 [意图分类] 意图: {intent_result.intent.value}, 置信度: {intent_result.confidence:.3f}")
+    Args:
+        prompt: 用户输入的问题
+        query_type: 查询类型（analysis: 日志分析, general_chat: 日常聊天）
+        history_context: 历史对话上下文字符串（没有结构化轮次的旧会话才需要解析）
+        history_turns: 会话的结构化轮次（ConversationSession.turns，写入时已压缩），直接转换为消息
     
-    # 如果是工具类意图，执行工具并将结果传递给LLM
-    tool_result = None
-    if intent_result.intent in TOOL_INTENTS:
-        print(f"🔧 [工具调用] 检测到工具类意图: {intent_result.intent.value}")
-        tool_func = classifier.tools.get(intent_result.intent)
-        if tool_func:
-            tool_result = tool_func(prompt)
-            print(f"✅ [工具执行] 工具执行完成，结果长度: {len(tool_result)} 字符")
-            print(f"🔧 [工具结果] 将工具结果传递给LLM进行分析和流式回答")
-        else:
-            print(f"⚠️ [工具调用] 未找到对应的工具函数: {intent_result.intent.value}")
+    Returns:
+        异步生成器，逐块返回 ChatResponse
+    """
+    logger.info("🤖 [流式调用] 开始流式调用 DeepSeek API, query_type: '%s', Prompt长度: %d 字符, 历史上下文长度: %d 字符",
+                query_type, len(prompt), len(history_context))
     
-    from model_config import CURRENT_CONFIG
     use_api = CURRENT_CONFIG.get('use_api', False)
     
     if not use_api:
         raise Exception("流式输出仅支持 API 模式")
     
-    from deepseek_llm import DeepSeekLLM
-    from llama_index.core.llms import ChatMessage
-    
-    # 解析历史上下文，构建消息列表
-    messages = []
-    if history_context:
-        print(f"🤖 [历史解析] 解析历史对话...")
-        from .conversation_manager import ConversationManager
-        conversation_manager = ConversationManager(max_context_length=4000, max_turns=10)
-        
-        # 解析并压缩历史
-        historical_turns = conversation_manager.parse_conversation_history(history_context)
-        compressed_turns = conversation_manager.compress_context(historical_turns)
-        
-        print(f"🤖 [历史压缩] 原始轮次: {len(historical_turns)}, 压缩后: {len(compressed_turns)}")
-        
-        # 将历史转换为消息列表
-        for turn in compressed_turns:
-            messages.append(ChatMessage(role="user", content=turn.user_input))
-            messages.append(ChatMessage(role="assistant", content=turn.assistant_reply))
+    # analysis 模式的日志检索不依赖意图分类和历史构建，先在后台启动，与后续步骤重叠执行
+    logs_task = asyncio.ensure_future(aretrieve_logs(prompt)) if query_type == "analysis" else None
     
-    # 如果执行了工具，将工具结果作为上下文传递给LLM进行流式回答
-    if tool_result:
-        # 构建包含工具结果的prompt
-        enhanced_prompt = f"""用户问题：{prompt}
-
-工具执行结果：
-{tool_result}
-
-请基于以上工具执行结果，对用户的问题进行详细分析和回答。要求：
-1. 对工具结果进行总结和分析
-2. 指出关键问题和异常
-3. 提供具体的建议和解决方案
-4. 用清晰、专业的方式组织回答"""
+    try:
+        # 先进行意图分类，检查是否为工具类意图
+        classifier = get_intent_classifier()
+        intent_result = await classifier.aclassify_intent(prompt)
         
-        print(f"🤖 [工具增强Prompt] 构建完成，长度: {len(enhanced_prompt)} 字符")
-        messages.append(ChatMessage(role="user", content=enhanced_prompt))
+        logger.info("🔍 [意图分类] 意图: %s, 置信度: %.3f", intent_result.intent.value, intent_result.confidence)
         
-        # 流式调用 LLM
-        llm = DeepSeekLLM(model=CURRENT_CONFIG['llm'], timeout=120)
-        print(f"🤖 [流式生成] 开始基于工具结果流式生成回复...")
-        return llm.stream_chat(messages)
-    
-    # 根据 query_type 决定是否使用 RAG
-    if query_type == "analysis":
-        # 日志分析模式：使用 RAG 检索，然后流式生成
-        print(f"🤖 [RAG模式] 日志分析，先进行 RAG 检索...")
-        system = get_log_system()
+        # 如果是工具类意图，执行工具并将结果传递给LLM
+        tool_result = None
+        if intent_result.intent in TOOL_INTENTS:
+            logger.info("🔧 [工具调用] 检测到工具类意图: %s", intent_result.intent.value)
+            tool_func = classifier.tools.get(intent_result.intent)
+            if tool_func:
+                tool_result = await sync_to_async(tool_func, thread_sensitive=False)(prompt)
+                logger.info("✅ [工具执行] 工具执行完成，结果长度: %d 字符", len(tool_result))
+            else:
+                logger.warning("⚠️ [工具调用] 未找到对应的工具函数: %s", intent_result.intent.value)
         
-        # 1. RAG 检索相关日志
-        log_results = system.retrieve_logs(prompt)
-        print(f"🤖 [RAG检索] 检索到 {len(log_results)} 条相关日志")
+        from llama_index.core.llms import ChatMessage
         
-        # 2. 构建包含检索结果的 prompt
-        rag_prompt = system._build_prompt_string(prompt, log_results, query_type)
-        print(f"🤖 [RAG Prompt] 构建完成，长度: {len(rag_prompt)} 字符")
+        # 解析历史上下文，构建消息列表
+        messages = []
+        if history_turns:
+            # 结构化轮次在每轮结束写入时已完成窗口截取和摘要压缩，这里无需再解析和压缩
+            for record in history_turns:
+                messages.append(ChatMessage(role="user", content=record["u"]))
+                messages.append(ChatMessage(role="assistant", content=record["r"]))
+            logger.debug("🤖 [历史加载] 使用已压缩的结构化轮次: %d", len(history_turns))
+        elif history_context:
+            logger.debug("🤖 [历史解析] 解析历史对话...")
+            conversation_manager = get_conversation_manager()
+            
+            # 流式解析，只保留最近 max_turns + 1 轮：多出的一轮足以让 compress_context 判断是否超出窗口
+            historical_turns = list(deque(conversation_manager.iter_turns(history_context),
+                                          maxlen=conversation_manager.max_turns + 1))
+            compressed_turns = conversation_manager.compress_context(historical_turns)
+            
+            logger.debug("🤖 [历史压缩] 读取轮次: %d, 压缩后: %d", len(historical_turns), len(compressed_turns))
+            
+            # 将历史转换为消息列表
+            for turn in compressed_turns:
+                messages.append(ChatMessage(role="user", content=turn.user_input))
+                messages.append(ChatMessage(role="assistant", content=turn.assistant_reply))
         
-        # 3. 添加当前用户输入（使用RAG增强的prompt）
-        messages.append(ChatMessage(role="user", content=rag_prompt))
+        # 如果执行了工具，将工具结果作为上下文传递给LLM进行流式回答
+        if tool_result:
+            # 工具结果已足够回答，不再需要日志检索
+            if logs_task is not None:
+                logs_task.cancel()
+            
+            # 构建包含工具结果的prompt
+            enhanced_prompt = _build_tool_prompt(prompt, tool_result)
+            
+            logger.debug("🤖 [工具增强Prompt] 构建完成，长度: %d 字符", len(enhanced_prompt))
+            messages.append(ChatMessage(role="user", content=enhanced_prompt))
+            
+            # 流式调用 LLM
+            llm = get_llm(CURRENT_CONFIG['llm'], 120)
+            logger.debug("🤖 [流式生成] 开始基于工具结果流式生成回复...")
+            return await llm.astream_chat(messages)
         
-        print(f"🤖 [消息列表] 总消息数: {len(messages)} (包含历史)")
-    else:
-        # 日常聊天模式：直接添加用户输入
-        print(f"🤖 [纯对话模式] 日常聊天，直接流式调用...")
-        messages.append(ChatMessage(role="user", content=prompt))
+        # 根据 query_type 决定是否使用 RAG
+        if query_type == "analysis":
+            # 日志分析模式：使用 RAG 检索，然后流式生成
+            logger.debug("🤖 [RAG模式] 日志分析，等待 RAG 检索结果...")
+            system = await sync_to_async(get_log_system, thread_sensitive=False)()
+            
+            # 1. RAG 检索相关日志（后台检索失败时在这里重新检索，让异常直接返回给调用方）
+            log_results = await logs_task
+            if log_results is None:
+                log_results = await sync_to_async(system.retrieve_logs, thread_sensitive=False)(prompt)
+            logger.info("🤖 [RAG检索] 检索到 %d 条相关日志", len(log_results))
+            
+            # 2. 构建包含检索结果的 prompt
+            rag_prompt = system._build_prompt_string(prompt, log_results, query_type)
+            logger.debug("🤖 [RAG Prompt] 构建完成，长度: %d 字符", len(rag_prompt))
+            
+            # 3. 添加当前用户输入（使用RAG增强的prompt）
+            messages.append(ChatMessage(role="user", content=rag_prompt))
+            
+            logger.debug("🤖 [消息列表] 总消息数: %d (包含历史)", len(messages))
+        else:
+            # 日常聊天模式：直接添加用户输入
+            logger.debug("🤖 [纯对话模式] 日常聊天，直接流式调用...")
+            messages.append(ChatMessage(role="user", content=prompt))
+            
+            logger.debug("🤖 [消息列表] 总消息数: %d (包含历史)", len(messages))
         
-        print(f"🤖 [消息列表] 总消息数: {len(messages)} (包含历史)")
-    
-    # 流式调用 LLM
-    llm = DeepSeekLLM(model=CURRENT_CONFIG['llm'], timeout=120)
-    print(f"🤖 [流式生成] 开始流式生成回复...")
-    return llm.stream_chat(messages)
+        # 流式调用 LLM
+        llm = get_llm(CURRENT_CONFIG['llm'], 120)
+        logger.debug("🤖 [流式生成] 开始流式生成回复...")
+        return await llm.astream_chat(messages)
+    except BaseException:
+        # 任何一步失败（含请求被取消）时一并取消后台检索，避免其在无人等待的情况下继续运行
+        if logs_task is not None:
+            logs_task.cancel()
+        raise
 
 def create_api_key(user: str) -> str:
     """创建 API Key 并保存到数据库"""
     key = APIKey.generate_key()
     expiry = time.time() + settings.TOKEN_EXPIRY_SECONDS
     
-    api_key = APIKey.objects.create(
+    APIKey.objects.create(
         key=key,
         user=user,
         expiry_time=expiry
     )
     
-    # 创建对应的速率限制记录
-    RateLimit.objects.create(
-        api_key=api_key,
-        reset_time=time.time() + settings.RATE_LIMIT_INTERVAL
-    )
-    
     return key
 
 def validate_api_key(key_str: str) -> bool:
-    """验证 API Key 是否存在且未过期"""
+    """验证 API Key 是否存在且未过期（复用认证缓存，命中时只做一次时间比较）"""
+    api_key = get_api_key(key_str)
+    if api_key is None:
+        return False
+    if api_key.is_valid():
+        return True
+    api_key.delete()  # 删除过期key（post_delete 信号会同时清除认证缓存）
+    return False
+
+# API Key 认证缓存：key 字符串 -> (APIKey 对象, 过期时间)，按 LRU 淘汰
+API_KEY_CACHE_MAXSIZE = 4096
+API_KEY_CACHE_TTL = 60  # 秒
+_api_key_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_api_key_cache_lock = threading.Lock()
+
+def get_api_key(key_str: str) -> Optional[APIKey]:
+    """
+    按 key 字符串获取 APIKey（带 TTL + LRU 进程内缓存）
+    认证在每个请求上执行，而 Key 很少变化，命中缓存时可省去一次数据库查询
+    
+    Args:
+        key_str: 请求头中的 API Key
+        
+    Returns:
+        APIKey对象，不存在时返回 None
+    """
+    now = time.monotonic()
+    with _api_key_cache_lock:
+        entry = _api_key_cache.get(key_str)
+        if entry is not None:
+            api_key, expires_at = entry
+            if now < expires_at:
+                _api_key_cache.move_to_end(key_str)
+                return api_key
+            del _api_key_cache[key_str]
+    
     try:
-        api_key = APIKey.objects.get(key=key_str)
-        if api_key.is_valid():
-            return True
-        else:
-            api_key.delete()  # 删除过期key
-            return False
+        # 只取认证和有效期校验会用到的字段（id 总会被加载）
+        api_key = APIKey.objects.only('key', 'user', 'expiry_time').get(key=key_str)
     except APIKey.DoesNotExist:
-        return False
+        return None
+    
+    with _api_key_cache_lock:
+        _api_key_cache[key_str] = (api_key, now + API_KEY_CACHE_TTL)
+        _api_key_cache.move_to_end(key_str)
+        while len(_api_key_cache) > API_KEY_CACHE_MAXSIZE:
+            _api_key_cache.popitem(last=False)
+    return api_key
 
-def check_rate_limit(key_str: str) -> bool:
-    """检查 API Key 的请求频率是否超过限制"""
-    with rate_lock:
-        try:
-            # api_key = APIKey.objects.get(key=key_str)
-            # rate_limit = RateLimit.objects.get(api_key=api_key)
-            rate_limit = RateLimit.objects.select_related('api_key').get(api_key__key=key_str)
-            
-            current_time = time.time()
-            if current_time > rate_limit.reset_time:
-                rate_limit.count = 1
-                rate_limit.reset_time = current_time + settings.RATE_LIMIT_INTERVAL
-                rate_limit.save()
-                return True
-            elif rate_limit.count < settings.RATE_LIMIT_MAX:
-                rate_limit.count += 1
-                rate_limit.save()
-                return True
-            else:
-                return False
-        except RateLimit.DoesNotExist:
-            # 如果速率限制记录不存在，创建一个新的
-            try:
-                current_time = time.time()
-                api_key = APIKey.objects.get(key=key_str)
-                RateLimit.objects.create(
-                    api_key=api_key,
-                    count=1,
-                    reset_time=current_time + settings.RATE_LIMIT_INTERVAL
-                )
-                return True
-            except APIKey.DoesNotExist:
-                return False
-
-# def get_or_create_session(session_id: str, user: APIKey) -> ConversationSession:
-    # """获取或创建会话，关联当前用户（通过API Key）"""
-    # session, created = ConversationSession.objects.get_or_create(
-        # session_id=session_id,
-        # user=user,  # 绑定用户
-        # defaults={'context': ''}
-    # )
-    # return session
+@receiver([post_save, post_delete], sender=APIKey)
+def invalidate_api_key_cache(sender, instance, **kwargs):
+    """APIKey 被修改或删除（吊销）时清除对应的认证缓存"""
+    with _api_key_cache_lock:
+        _api_key_cache.pop(instance.key, None)
+
+def check_rate_limit(key: "str | APIKey") -> bool:
+    """
+    检查 API Key 的请求频率是否超过限制（固定窗口计数）
+    
+    计数保存在 Django 缓存中，随窗口一起过期：cache.add / cache.incr 本身是原子操作，
+    不需要进程内的全局锁，每个请求也不再读写一次数据库。
+    默认的 LocMemCache 按进程计数，多进程部署时在 CACHES 中配置 Redis / Memcached 即可全局限流
+    
+    Args:
+        key: API Key 字符串，或认证阶段已取得的 APIKey 对象（直接使用，不再查找）
+    """
+    api_key = key if isinstance(key, APIKey) else get_api_key(key)
+    if api_key is None:
+        return False
+    
+    interval = settings.RATE_LIMIT_INTERVAL
+    cache_key = f"ratelimit:{api_key.pk}:{int(time.time()) // interval}"
+    # 窗口内的第一个请求创建计数（键已存在时 add 不会覆盖）
+    cache.add(cache_key, 0, timeout=interval)
+    try:
+        count = cache.incr(cache_key)
+    except ValueError:
+        # 计数恰好在 add 与 incr 之间过期：按新窗口的第一个请求处理
+        cache.set(cache_key, 1, timeout=interval)
+        count = 1
+    return count <= settings.RATE_LIMIT_MAX
 
 def get_or_create_session(session_id: str, user: APIKey) -> ConversationSession:
     """
@@ -364,56 +467,167 @@ def get_or_create_session(session_id: str, user: APIKey) -> ConversationSession:
     - 若用户+session_id已存在 → 加载旧会话（保留历史）
     - 若不存在 → 创建新会话（空历史）
     """
-    print(f"🔍 [数据库查询] 查找会话: session_id='{session_id}', user='{user.user}'")
+    logger.debug("🔍 [数据库查询] 查找会话: session_id='%s', user='%s'", session_id, user.user)
+    
+    # 上一轮的后台保存尚未落库时先等待，避免读到旧历史后用本轮的保存覆盖上一轮
+    _wait_for_pending_save(session_id, user.pk)
     
     session, created = ConversationSession.objects.get_or_create(
         session_id=session_id,  # 匹配会话ID
         user=user,              # 匹配当前用户（关键！避免跨用户会话冲突）
         defaults={'context': ''}
     )
+    # 复用认证阶段已取得的 APIKey，避免访问 session.user 时再查一次数据库
+    session.user = user
     
     # 调试日志：确认是否创建新会话（created=True 表示新会话）
-    import logging
-    logger = logging.getLogger(__name__)
-    
     if created:
-        print(f"✨ [数据库操作] 创建新会话 - ID: {session.id}, session_id: '{session.session_id}'")
-        print(f"✨ [新会话详情] 用户: {session.user.user}, 上下文: 空")
-        logger.info(f"会话 {session_id}（用户：{user.user}）创建新会话")
+        logger.debug("✨ [数据库操作] 创建新会话 - ID: %s, session_id: '%s'", session.id, session.session_id)
+        logger.info("会话 %s（用户：%s）创建新会话", session_id, user.user)
     else:
-        print(f"📂 [数据库操作] 加载现有会话 - ID: {session.id}, session_id: '{session.session_id}'")
-        print(f"📂 [现有会话详情] 用户: {session.user.user}, 上下文长度: {len(session.context)} 字符")
-        print(f"📂 [会话创建时间] {session.created_at}")
-        print(f"📂 [会话更新时间] {session.updated_at}")
+        logger.debug("📂 [数据库操作] 加载现有会话 - ID: %s, session_id: '%s', 上下文长度: %d 字符, 更新时间: %s",
+                     session.id, session.session_id, len(session.context), session.updated_at)
         if session.context:
-            print(f"📂 [历史上下文预览] {session.context[:150]}{'...' if len(session.context) > 150 else ''}")
-        logger.info(f"会话 {session_id}（用户：{user.user}）加载旧会话")
+            logger.debug("📂 [历史上下文预览] %.150s", session.context)
+        logger.info("会话 %s（用户：%s）加载旧会话", session_id, user.user)
     
     return session
 
+# 会话保存线程：按会话分片到单线程执行器，保证同一会话的写入（含清空）按提交顺序执行
+SESSION_SAVE_SHARDS = 4
+_session_save_executors = [
+    ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"session-save-{i}")
+    for i in range(SESSION_SAVE_SHARDS)
+]
+
+# 每个会话最近一次提交、尚未完成的后台保存：(user_id, session_id) -> Future
+_pending_session_saves: Dict[tuple, Future] = {}
+_pending_session_saves_lock = threading.Lock()
+
+def _session_executor(key: tuple) -> ThreadPoolExecutor:
+    """同一会话固定落在同一个单线程执行器上"""
+    return _session_save_executors[hash(key) % SESSION_SAVE_SHARDS]
+
+def _forget_pending_save(key: tuple, future: Future):
+    """保存完成后移除记录（期间又提交了新的保存时保留新记录）"""
+    with _pending_session_saves_lock:
+        if _pending_session_saves.get(key) is future:
+            del _pending_session_saves[key]
+
+def _wait_for_pending_save(session_id: str, user_id: int):
+    """
+    等待该会话已提交的后台保存完成
+    同一会话的保存在单线程执行器上按顺序执行，等待最近一次即可
+    """
+    with _pending_session_saves_lock:
+        future = _pending_session_saves.get((user_id, session_id))
+    if future is not None:
+        logger.debug("⏳ [会话保存] 等待会话 %s 的后台保存完成", session_id)
+        future.result()
+
+def _save_session(session: ConversationSession):
+    """在后台线程中保存会话"""
+    close_old_connections()
+    try:
+        # 只写入对话相关字段，不重写 session_id / user / created_at
+        session.save(update_fields=['context', 'turns', 'updated_at'])
+    except Exception as e:
+        logger.error("后台保存会话 %s 失败: %s", session.session_id, e)
+    finally:
+        close_old_connections()
+
+def save_session_in_background(session: ConversationSession):
+    """
+    将会话保存提交到后台线程，请求无需等待数据库写入即可返回
+    （进程在写入前退出时最多丢失最后一轮对话）
+    下一次 get_or_create_session / clear_session 会先等待该保存完成
+    
+    Args:
+        session: 已更新 context/turns 的会话对象，提交后调用方不应再修改它
+    """
+    key = (session.user_id, session.session_id)
+    with _pending_session_saves_lock:
+        future = _session_executor(key).submit(_save_session, session)
+        _pending_session_saves[key] = future
+    future.add_done_callback(lambda f: _forget_pending_save(key, f))
+
+def _clear_session(session_id: str, user: APIKey) -> int:
+    """在会话的保存线程中清空历史"""
+    close_old_connections()
+    try:
+        return ConversationSession.objects.filter(session_id=session_id, user=user).update(
+            context="", turns=[], updated_at=timezone.now()
+        )
+    finally:
+        close_old_connections()
+
+def clear_session(session_id: str, user: APIKey) -> int:
+    """
+    清空会话历史：单条 UPDATE，无需先查询或创建会话
+    提交到该会话的保存线程执行，排在已提交的后台保存之后，避免被尚未落库的旧历史覆盖
+    
+    Returns:
+        受影响的行数（会话不存在时为 0）
+    """
+    key = (user.pk, session_id)
+    return _session_executor(key).submit(_clear_session, session_id, user).result()
+
+def _reply_cache_key(prompt: str, session_id: str, user: APIKey) -> str:
+    """
+    回复缓存键：包含 user 和 session_id 避免跨会话冲突
+    prompt 取 SHA-256 摘要而非内置 hash()——后者按进程随机化，多个工作进程之间无法共享缓存
+    """
+    return f"reply:{user.user}:{session_id}:{generate_cache_key(prompt)}"
+
+# 回复缓存的存储格式：1 字节版本标记 + 数据（格式变更时换新标记，旧条目按未命中处理，不会被误解码）
+_REPLY_FORMAT_RAW = b"\x01"   # UTF-8 原文
+_REPLY_FORMAT_ZLIB = b"\x02"  # zlib 压缩后的 UTF-8
+_REPLY_COMPRESS_MIN_CHARS = 512  # 短回复压缩收益小于开销，直接保存原文
+_REPLY_COMPRESS_LEVEL = 3
+
+def _encode_reply(reply: str) -> bytes:
+    """将回复编码为缓存值：长回复（中文 UTF-8 通常可压缩到 1/3 左右）用 zlib 压缩"""
+    data = reply.encode("utf-8")
+    if len(reply) > _REPLY_COMPRESS_MIN_CHARS:
+        return _REPLY_FORMAT_ZLIB + zlib.compress(data, _REPLY_COMPRESS_LEVEL)
+    return _REPLY_FORMAT_RAW + data
+
+def _decode_reply(raw) -> Optional[str]:
+    """解码缓存值，无法识别的格式视为未命中"""
+    if isinstance(raw, str):
+        return raw  # 升级前写入的原文字符串
+    if not isinstance(raw, bytes) or not raw:
+        return None
+    tag, data = raw[:1], raw[1:]
+    try:
+        if tag == _REPLY_FORMAT_ZLIB:
+            return zlib.decompress(data).decode("utf-8")
+        if tag == _REPLY_FORMAT_RAW:
+            return data.decode("utf-8")
+    except (zlib.error, UnicodeDecodeError) as e:
+        logger.warning("⚠️ [缓存解码] 缓存回复解码失败，按未命中处理: %s", e)
+    return None
+
 def get_cached_reply(prompt: str, session_id: str, user: APIKey) -> str | None:
     """缓存键包含 session_id 和 user，避免跨会话冲突"""
-    cache_key = f"reply:{user.user}:{session_id}:{hash(prompt)}"
-    print(f"🔍 [缓存查询] 缓存键: {cache_key}")
+    cache_key = _reply_cache_key(prompt, session_id, user)
+    logger.debug("🔍 [缓存查询] 缓存键: %s", cache_key)
     
-    cached_result = cache.get(cache_key)
+    cached_result = _decode_reply(cache.get(cache_key))
     if cached_result:
-        print(f"✅ [缓存命中] 找到缓存回复，长度: {len(cached_result)} 字符")
-        print(f"💾 [缓存内容] {cached_result[:80]}{'...' if len(cached_result) > 80 else ''}")
+        logger.debug("✅ [缓存命中] 找到缓存回复，长度: %d 字符", len(cached_result))
+        logger.debug("💾 [缓存内容] %.80s", cached_result)
     else:
-        print(f"❌ [缓存未命中] 缓存中没有找到对应回复")
+        logger.debug("❌ [缓存未命中] 缓存中没有找到对应回复")
     
     return cached_result
 
 def set_cached_reply(prompt: str, reply: str, session_id: str, user: APIKey, timeout=3600):
-    cache_key = f"reply:{user.user}:{session_id}:{hash(prompt)}"
-    print(f"💾 [缓存保存] 保存回复到缓存")
-    print(f"💾 [缓存键] {cache_key}")
-    print(f"💾 [缓存内容] 长度: {len(reply)} 字符, 过期时间: {timeout}秒")
-    print(f"💾 [回复预览] {reply[:80]}{'...' if len(reply) > 80 else ''}")
-    
-    cache.set(cache_key, reply, timeout)
-    print(f"✅ [缓存完成] 回复已成功保存到缓存")
+    cache_key = _reply_cache_key(prompt, session_id, user)
+    logger.debug("💾 [缓存保存] 缓存键: %s, 长度: %d 字符, 过期时间: %d秒", cache_key, len(reply), timeout)
+    logger.debug("💾 [回复预览] %.80s", reply)
+    
+    cache.set(cache_key, _encode_reply(reply), timeout)
 
 
 def generate_cache_key(original_key: str) -> str:
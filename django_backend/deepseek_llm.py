@@ -2,13 +2,16 @@
 DeepSeek LLM 包装类
 兼容 llama-index 的 LLM 接口，使用 DeepSeek API
 """
+import json
 import logging
+import httpx
 import requests
 from typing import Any, Dict, Optional, Sequence
 from llama_index.core.llms import (
     LLM,
     ChatMessage,
     ChatResponse,
+    ChatResponseAsyncGen,
     ChatResponseGen,
     CompletionResponse,
     CompletionResponseGen,
@@ -16,6 +19,7 @@ from llama_index.core.llms import (
 )
 from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
 from deepseek_config import get_api_key, DEEPSEEK_BASE_URL, DEFAULT_DEEPSEEK_MODEL, DEEPSEEK_API_PARAMS, DEEPSEEK_TIMEOUT
+from http_client import get_async_client, get_http_session
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +57,11 @@ class DeepSeekLLM(LLM):
         self._temperature = temperature
         self._max_tokens = max_tokens
         self._timeout = timeout
+        self._url = f"{self._base_url}/v1/chat/completions"
+        self._headers = {
+            "Authorization": f"Bearer {self._api_key}",
+            "Content-Type": "application/json",
+        }
         
         if not self._api_key:
             raise ValueError(
@@ -93,12 +102,6 @@ class DeepSeekLLM(LLM):
                 "content": msg.content,
             })
         
-        # 调用 DeepSeek API
-        headers = {
-            "Authorization": f"Bearer {self._api_key}",
-            "Content-Type": "application/json",
-        }
-        
         payload = {
             "model": self._model,
             "messages": api_messages,
@@ -109,9 +112,9 @@ class DeepSeekLLM(LLM):
         
         try:
             logger.info(f"🚀 调用 DeepSeek API - 模型: {self._model}")
-            response = requests.post(
-                f"{self._base_url}/v1/chat/completions",
-                headers=headers,
+            response = get_http_session().post(
+                self._url,
+                headers=self._headers,
                 json=payload,
                 timeout=self._timeout,
             )
@@ -169,12 +172,6 @@ class DeepSeekLLM(LLM):
                 "content": msg.content,
             })
         
-        # 调用 DeepSeek API (流式)
-        headers = {
-            "Authorization": f"Bearer {self._api_key}",
-            "Content-Type": "application/json",
-        }
-        
         payload = {
             "model": self._model,
             "messages": api_messages,
@@ -185,9 +182,9 @@ class DeepSeekLLM(LLM):
         
         try:
             logger.info(f"🚀 调用 DeepSeek API (流式) - 模型: {self._model}")
-            response = requests.post(
-                f"{self._base_url}/v1/chat/completions",
-                headers=headers,
+            response = get_http_session().post(
+                self._url,
+                headers=self._headers,
                 json=payload,
                 timeout=self._timeout,
                 stream=True,  # 流式响应
@@ -238,18 +235,143 @@ class DeepSeekLLM(LLM):
     async def achat(
         self, messages: Sequence[ChatMessage], **kwargs: Any
     ) -> ChatResponse:
-        """异步聊天（暂不支持，调用同步版本）"""
-        return self.chat(messages, **kwargs)
+        """
+        异步聊天接口（使用共享的 httpx.AsyncClient，不阻塞事件循环）
+        
+        Args:
+            messages: 消息列表
+            **kwargs: 其他参数
+            
+        Returns:
+            ChatResponse 对象
+        """
+        api_messages = [{"role": msg.role, "content": msg.content} for msg in messages]
+        
+        payload = {
+            "model": self._model,
+            "messages": api_messages,
+            "temperature": kwargs.get("temperature", self._temperature),
+            "max_tokens": kwargs.get("max_tokens", self._max_tokens),
+            "stream": False,
+        }
+        
+        try:
+            logger.info(f"🚀 调用 DeepSeek API (异步) - 模型: {self._model}")
+            response = await get_async_client().post(
+                self._url,
+                headers=self._headers,
+                json=payload,
+                timeout=self._timeout,
+            )
+            response.raise_for_status()
+            
+            result = response.json()
+            content = result["choices"][0]["message"]["content"]
+            
+            logger.info(f"✅ DeepSeek API 响应成功 - 长度: {len(content)} 字符")
+            
+            return ChatResponse(
+                message=ChatMessage(role="assistant", content=content),
+                raw=result,
+            )
+        
+        except httpx.TimeoutException:
+            logger.error(f"❌ DeepSeek API 超时 - 超时时间: {self._timeout}秒")
+            raise Exception(f"DeepSeek API 调用超时（{self._timeout}秒）")
+        
+        except httpx.HTTPError as e:
+            logger.error(f"❌ DeepSeek API 请求失败: {e}")
+            if isinstance(e, httpx.HTTPStatusError):
+                logger.error(f"错误详情: {e.response.text}")
+            raise Exception(f"DeepSeek API 调用失败: {e}")
     
     async def acomplete(self, prompt: str, **kwargs: Any) -> CompletionResponse:
-        """异步补全（暂不支持，调用同步版本）"""
-        return self.complete(prompt, **kwargs)
+        """异步补全接口（通过 achat 实现）"""
+        messages = [ChatMessage(role="user", content=prompt)]
+        chat_response = await self.achat(messages, **kwargs)
+        
+        return CompletionResponse(
+            text=chat_response.message.content,
+            raw=chat_response.raw,
+        )
     
     async def astream_chat(
         self, messages: Sequence[ChatMessage], **kwargs: Any
-    ) -> ChatResponseGen:
-        """异步流式聊天（暂不支持）"""
-        raise NotImplementedError("DeepSeek 异步流式聊天暂未实现")
+    ) -> ChatResponseAsyncGen:
+        """
+        异步流式聊天（使用共享的 httpx.AsyncClient，等待模型输出时不占用线程）
+        
+        Args:
+            messages: 消息列表
+            **kwargs: 其他参数
+            
+        Returns:
+            异步生成器，逐块返回 ChatResponse（delta 为本块增量，message.content 为累积文本）
+        """
+        api_messages = [{"role": msg.role, "content": msg.content} for msg in messages]
+        
+        payload = {
+            "model": self._model,
+            "messages": api_messages,
+            "temperature": kwargs.get("temperature", self._temperature),
+            "max_tokens": kwargs.get("max_tokens", self._max_tokens),
+            "stream": True,  # 开启流式
+        }
+        
+        client = get_async_client()
+        request = client.build_request(
+            "POST",
+            self._url,
+            headers=self._headers,
+            json=payload,
+            timeout=self._timeout,
+        )
+        
+        try:
+            logger.info(f"🚀 调用 DeepSeek API (异步流式) - 模型: {self._model}")
+            response = await client.send(request, stream=True)
+            if response.is_error:
+                # 流式响应需先读取响应体，错误详情才可用
+                await response.aread()
+                await response.aclose()
+                response.raise_for_status()
+        
+        except httpx.TimeoutException:
+            logger.error(f"❌ DeepSeek API 超时 - 超时时间: {self._timeout}秒")
+            raise Exception(f"DeepSeek API 调用超时（{self._timeout}秒）")
+        
+        except httpx.HTTPError as e:
+            logger.error(f"❌ DeepSeek API 请求失败: {e}")
+            if isinstance(e, httpx.HTTPStatusError):
+                logger.error(f"错误详情: {e.response.text}")
+            raise Exception(f"DeepSeek API 调用失败: {e}")
+        
+        # 异步生成器：逐块返回，结束或被中途放弃时关闭响应
+        async def gen():
+            full_text = ""
+            try:
+                async for line in response.aiter_lines():
+                    if not line.startswith('data: '):
+                        continue
+                    data_text = line[6:]  # 去掉 'data: '
+                    if data_text == '[DONE]':
+                        break
+                    try:
+                        data = json.loads(data_text)
+                        content = data['choices'][0].get('delta', {}).get('content', '')
+                    except (ValueError, KeyError, IndexError):
+                        continue
+                    if content:
+                        full_text += content
+                        yield ChatResponse(
+                            message=ChatMessage(role="assistant", content=full_text),
+                            delta=content,
+                            raw=data,
+                        )
+            finally:
+                await response.aclose()
+        
+        return gen()
     
     async def astream_complete(
         self, prompt: str, **kwargs: Any
@@ -273,8 +395,11 @@ def create_deepseek_embedding(model_name: str = "nomic-embed-text", **kwargs):
         "   请确保 Ollama 服务正在运行: ollama serve"
     )
     
+    from http_client import OLLAMA_EMBED_BATCH_SIZE
+    
     return OllamaEmbedding(
         model_name=model_name,
-        request_timeout=300.0
+        request_timeout=300.0,
+        embed_batch_size=OLLAMA_EMBED_BATCH_SIZE
     )
 
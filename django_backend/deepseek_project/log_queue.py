@@ -0,0 +1,23 @@
+"""
+异步日志输出
+请求线程只把日志记录放入队列，由后台 QueueListener 线程负责格式化并写入控制台，
+避免在请求路径上同步写 stdout
+"""
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def queue_handler() -> QueueHandler:
+    """创建 QueueHandler，并启动写入控制台的后台 QueueListener（供 LOGGING 配置的 "()" 工厂调用）"""
+    log_queue = queue.SimpleQueue()
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = QueueListener(log_queue, console, respect_handler_level=True)
+    listener.start()
+    # 进程退出前刷新队列中剩余的日志
+    atexit.register(listener.stop)
+    return QueueHandler(log_queue)
@@ -109,3 +109,19 @@ RATE_LIMIT_MAX = 5000  # 每分钟最大请求数
 RATE_LIMIT_INTERVAL = 60
 CACHE_MAX_SIZE = 200
 CACHE_EXPIRY = 300
+SEMANTIC_CACHE_THRESHOLD = 0.92  # 语义缓存命中所需的余弦相似度
+
+# 日志：经 QueueHandler 交给后台线程输出，DJANGO_LOG_LEVEL=DEBUG 时输出调试详情
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'queue': {
+            '()': 'deepseek_project.log_queue.queue_handler',
+        },
+    },
+    'root': {
+        'handlers': ['queue'],
+        'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
+    },
+}
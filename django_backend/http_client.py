@@ -0,0 +1,152 @@
+"""
+共享 HTTP 客户端
+为 Ollama / DeepSeek 调用提供共享客户端：
+- 同步 requests.Session 在进程内跨请求复用 keep-alive 连接，避免每次调用重新建立 TCP/TLS 连接
+- 异步 httpx.AsyncClient 按事件循环创建；WSGI 下每个请求一个事件循环，只在请求内复用，请求结束时关闭
+
+Ollama 服务端相关环境变量（需在启动 ollama serve 之前设置）：
+- OLLAMA_NUM_PARALLEL: 单个模型同时处理的请求数（建议 >= 4），否则并发请求会在服务端排队
+- OLLAMA_KEEP_ALIVE:   模型在内存中的驻留时间；客户端请求中也会携带同名的 keep_alive 参数
+- OLLAMA_MAX_LOADED_MODELS: 可同时驻留的模型数（建议 >= 2，让意图分类模型与 RAG/Embedding 模型同时常驻）
+"""
+import asyncio
+import contextlib
+import os
+import threading
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def _parse_keep_alive(value: str):
+    """keep_alive 可以是时长字符串（如 "30m"）或秒数（负数表示常驻内存）"""
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+# 随请求发送给 Ollama 的模型驻留时间（默认 -1：常驻内存，避免空闲后被卸载导致冷启动）
+# 每次请求都会携带该值，因此服务端的卸载计时会被持续刷新
+OLLAMA_KEEP_ALIVE = _parse_keep_alive(os.getenv("OLLAMA_KEEP_ALIVE", "-1"))
+
+# 客户端批量请求（如批量意图分类）时同时发往 Ollama 的最大请求数，与服务端 OLLAMA_NUM_PARALLEL 保持一致
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+
+# 构建索引时每次 /api/embed 请求携带的文本条数（一次 POST 批量计算多条向量）
+OLLAMA_EMBED_BATCH_SIZE = int(os.getenv("OLLAMA_EMBED_BATCH_SIZE", "32"))
+
+# 同步 Session 连接池配置
+HTTP_POOL_CONNECTIONS = 16
+HTTP_POOL_MAXSIZE = 64
+
+# 异步客户端连接池配置
+ASYNC_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=64, max_connections=128)
+ASYNC_HTTP_TIMEOUT = 60
+
+# 每个事件循环一个 AsyncClient，以及该事件循环上仍在进行的 async_client_scope 数量
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_async_client_scopes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, int]" = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    获取当前事件循环对应的共享 httpx.AsyncClient（HTTP/2 + 连接池）
+
+    AsyncClient 的连接绑定在创建它的事件循环上，因此按事件循环缓存客户端。
+    以 WSGI 方式运行时，Django 会为每个异步视图创建新的事件循环，客户端只在
+    一次请求内复用（意图分类、embedding、大模型调用共用连接），不会跨请求保持连接。
+    调用方需在 async_client_scope() 内使用，范围结束时关闭客户端，避免连接泄漏。
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            http2=True,
+            limits=ASYNC_HTTP_LIMITS,
+            timeout=ASYNC_HTTP_TIMEOUT,
+        )
+        _async_clients[loop] = client
+    return client
+
+
+@contextlib.asynccontextmanager
+async def async_client_scope():
+    """
+    一次请求（或一次 asyncio.run）使用共享 AsyncClient 的范围，可作为 async with 或异步视图装饰器使用
+
+    同一事件循环上的范围可以嵌套或并发（ASGI 下多个请求共用一个事件循环），
+    最后一个范围结束时关闭并移除该事件循环的客户端。
+    """
+    loop = asyncio.get_running_loop()
+    _async_client_scopes[loop] = _async_client_scopes.get(loop, 0) + 1
+    try:
+        yield
+    finally:
+        remaining = _async_client_scopes[loop] - 1
+        if remaining:
+            _async_client_scopes[loop] = remaining
+        else:
+            del _async_client_scopes[loop]
+            client = _async_clients.pop(loop, None)
+            if client is not None:
+                await client.aclose()
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    获取进程内共享的 requests.Session（懒加载 + 线程安全）
+    复用 keep-alive 连接，避免每次调用都重新进行 DNS 解析和 TCP/TLS 握手
+    """
+    global _http_session
+    
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                # 仅对连接失败重试；POST 请求不会因读超时被重复发送
+                retry = Retry(total=2, connect=2, read=0, backoff_factor=0.1)
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=HTTP_POOL_MAXSIZE,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _http_session = session
+    
+    return _http_session
+
+
+def warmup_ollama_model(model: str, ollama_url: str = "http://localhost:11434", embedding: bool = False,
+                        timeout: float = 120) -> bool:
+    """
+    预加载 Ollama 模型（空 prompt 只加载模型、不做推理）
+    
+    Args:
+        model: 模型名称
+        ollama_url: Ollama服务地址
+        embedding: 是否为 embedding 模型（使用 /api/embed 预加载）
+        timeout: 超时时间（秒），首次加载大模型可能较慢
+        
+    Returns:
+        是否预加载成功
+    """
+    if embedding:
+        url, payload = f"{ollama_url}/api/embed", {"model": model, "input": "", "keep_alive": OLLAMA_KEEP_ALIVE}
+    else:
+        url, payload = f"{ollama_url}/api/generate", {"model": model, "prompt": "", "keep_alive": OLLAMA_KEEP_ALIVE}
+    
+    try:
+        response = get_http_session().post(url, json=payload, timeout=timeout)
+        response.raise_for_status()
+        return True
+    except requests.RequestException:
+        return False
@@ -12,6 +12,17 @@ from dataclasses import dataclass
 logger = logging.getLogger(__name__)
 
 
+def _compile_keywords(keywords) -> "re.Pattern":
+    """将关键词列表编译为一个交替正则，一次扫描即可判断是否包含任一关键词"""
+    return re.compile("|".join(map(re.escape, keywords)))
+
+
+# 检索意图识别用的关键词（模块加载时编译一次）
+_ERROR_WORD_PATTERN = _compile_keywords(['错误', 'error', '异常', 'exception', '失败', 'failure', 'bug'])
+_SOLUTION_WORD_PATTERN = _compile_keywords(['怎么', 'how', '解决', 'solve', 'fix', '修复', '如何'])
+_SEVERE_WORD_PATTERN = _compile_keywords(['严重', 'critical', 'fatal', '紧急'])
+
+
 @dataclass
 class OptimizedQuery:
     """优化后的查询"""
@@ -69,6 +80,12 @@ class QueryOptimizer:
             "信息": ["info", "information", "信息"],
         }
         
+        # 按类别预编译的关键词正则（保持字典顺序，先匹配到的类别优先）
+        self._error_type_patterns = [(error_type, _compile_keywords(patterns))
+                                     for error_type, patterns in self.error_patterns.items()]
+        self._level_patterns = [(level, _compile_keywords(keywords))
+                                for level, keywords in self.level_keywords.items()]
+        
         logger.info("查询优化器初始化完成")
     
     def optimize(self, query: str) -> OptimizedQuery:
@@ -150,9 +167,9 @@ class QueryOptimizer:
         query_lower = query.lower()
         
         # 错误相关查询
-        if any(word in query_lower for word in ['错误', 'error', '异常', 'exception', '失败', 'failure', 'bug']):
+        if _ERROR_WORD_PATTERN.search(query_lower):
             # 如果是寻求解决方案
-            if any(word in query_lower for word in ['怎么', 'how', '解决', 'solve', 'fix', '修复', '如何']):
+            if _SOLUTION_WORD_PATTERN.search(query_lower):
                 return 'solution_seeking'
             else:
                 # 错误诊断
@@ -232,8 +249,8 @@ class QueryOptimizer:
         query_lower = query.lower()
         
         # 检测日志级别
-        for level, keywords in self.level_keywords.items():
-            if any(keyword in query_lower for keyword in keywords):
+        for level, pattern in self._level_patterns:
+            if pattern.search(query_lower):
                 if level == "严重":
                     filters['level'] = 'FATAL'
                 elif level == "错误":
@@ -243,7 +260,7 @@ class QueryOptimizer:
                 break
         
         # 检测严重性阈值
-        if any(word in query_lower for word in ['严重', 'critical', 'fatal', '紧急']):
+        if _SEVERE_WORD_PATTERN.search(query_lower):
             filters['min_severity'] = 0.7
         
         return filters
@@ -271,8 +288,8 @@ class QueryOptimizer:
         """从查询中提取错误类型"""
         query_lower = query.lower()
         
-        for error_type, patterns in self.error_patterns.items():
-            if any(pattern in query_lower for pattern in patterns):
+        for error_type, pattern in self._error_type_patterns:
+            if pattern.search(query_lower):
                 return error_type
         
         return None
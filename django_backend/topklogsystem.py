@@ -19,6 +19,8 @@ from llama_index.vector_stores.chroma import ChromaVectorStore  # 注意导入
 from llama_index.llms.ollama import Ollama  # 使用 llama-index 的 Ollama
 from llama_index.embeddings.ollama import OllamaEmbedding  # 使用 llama-index 的 Embedding
 
+from http_client import OLLAMA_EMBED_BATCH_SIZE
+
 # langchain (仅用于 prompt)
 from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate
 
@@ -84,7 +86,8 @@ class TopKLogSystem:
             )
             self.embedding_model = OllamaEmbedding(
                 model_name=embedding_model,
-                request_timeout=300.0    # embedding 超时时间 5 分钟
+                request_timeout=300.0,   # embedding 超时时间 5 分钟
+                embed_batch_size=OLLAMA_EMBED_BATCH_SIZE  # 批量走 /api/embed，减少 HTTP 往返
             )
 
         # init database